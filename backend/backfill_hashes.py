@@ -0,0 +1,96 @@
+"""
+One-off: add content_hash to qa_pairs documents stored before deduplication.
+
+    python backfill_hashes.py [--batch 500] [--pause 0.2] [--delete-duplicates]
+
+Walks the collection in _id order in small batches of ordinary updates (no
+collection lock), so it can run against the live database and be stopped and
+restarted at any time. A document whose pair is already stored is marked with
+`duplicate_of` (kept out of the unique index), or deleted with --delete-duplicates.
+"""
+import argparse
+import asyncio
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+from utils.ingest import content_hash
+
+async def backfill(batch: int, pause: float, delete_duplicates: bool):
+    collection = db.get_db().qa_pairs
+    await collection.create_index(
+        [("content_hash", ASCENDING)], unique=True,
+        partialFilterExpression={"content_hash": {"$exists": True}},
+    )
+
+    hashed = 0
+    duplicates = 0
+    last_id = None
+    while True:
+        query = {"content_hash": {"$exists": False}, "duplicate_of": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        cursor = collection.find(
+            query, {"instruction": 1, "response": 1, "question": 1, "answer": 1}
+        ).sort("_id", ASCENDING).limit(batch)
+        docs = await cursor.to_list(length=batch)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        hashes = [
+            content_hash(doc.get("instruction", doc.get("question", "")),   # Fallback for old data
+                         doc.get("response", doc.get("answer", "")))
+            for doc in docs
+        ]
+        ops = [
+            UpdateOne({"_id": doc["_id"], "content_hash": {"$exists": False}},
+                      {"$set": {"content_hash": h}})
+            for doc, h in zip(docs, hashes)
+        ]
+        duplicate_indexes = []
+        try:
+            result = await collection.bulk_write(ops, ordered=False)
+            hashed += result.modified_count
+        except BulkWriteError as bwe:
+            hashed += bwe.details.get("nModified", 0)
+            for error in bwe.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                duplicate_indexes.append(error["index"])
+
+        for index in duplicate_indexes:
+            doc, h = docs[index], hashes[index]
+            original = await collection.find_one({"content_hash": h}, {"_id": 1})
+            if delete_duplicates:
+                await collection.delete_one({"_id": doc["_id"]})
+            else:
+                await collection.update_one(
+                    {"_id": doc["_id"]}, {"$set": {"duplicate_of": original["_id"] if original else None}}
+                )
+            duplicates += 1
+
+        print(f"  hashed {hashed}, duplicates {duplicates} (up to _id {last_id})")
+        # leave room for live traffic between batches
+        await asyncio.sleep(pause)
+
+    action = "deleted" if delete_duplicates else "marked"
+    print(f"Backfill complete: {hashed} documents hashed, {duplicates} duplicates {action}")
+
+async def run(args):
+    db.connect()
+    try:
+        await backfill(args.batch, args.pause, args.delete_duplicates)
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.2, help="seconds to sleep between batches")
+    parser.add_argument("--delete-duplicates", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
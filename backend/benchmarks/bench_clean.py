@@ -0,0 +1,132 @@
+"""
+clean_line throughput, checked against the original regex cascade.
+
+Every line of the corpus is first cleaned by both implementations and the run
+aborts on the first difference, so a speedup can never come from changed output.
+
+    python benchmarks/bench_clean.py --lines 200000
+"""
+import argparse
+import html
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.clean import (clean_line, clean_lines, REF_RE, TAG_RE, CITATION_RE, HEADING_RE,
+                         URL_RE, ASCII_LETTERS_RE, DIGIT_RE, NON_KANNADA_RE, MULTISPACE_RE)
+
+def reference_clean_line(line: str) -> str:
+    """The original ten-step cascade, kept verbatim as the compatibility oracle."""
+    line = html.unescape(line)
+    line = REF_RE.sub(" ", line)
+    line = TAG_RE.sub(" ", line)
+    line = CITATION_RE.sub(" ", line)
+    line = HEADING_RE.sub(" ", line)
+    line = URL_RE.sub(" ", line)
+    line = URL_RE.sub(" ", line)
+    line = ASCII_LETTERS_RE.sub("", line)
+    line = DIGIT_RE.sub("", line)
+    line = NON_KANNADA_RE.sub("", line)
+    line = MULTISPACE_RE.sub(" ", line).strip()
+    return line
+
+KANNADA_LETTERS = [chr(c) for c in range(0x0C85, 0x0CB9)] + [chr(c) for c in range(0x0CBE, 0x0CCD)]
+KANNADA_DIGITS = [chr(c) for c in range(0x0CE6, 0x0CF0)]
+ENGLISH = ["the", "Tulu", "page", "Chapter", "ISBN", "Press", "Mangalore", "vol.", "pp."]
+NOISE = ["|", "—", "“", "”", "…", "•", "०१", " ", "‌", "‍", "\t", "l1", "©"]
+
+# Lines that exercise the order-dependent corners of the cascade
+EDGE_CASES = [
+    "",
+    "   ",
+    "ಕನ್ನಡ",
+    "ಕನ್ನಡ ೧೨೩ ಪುಟ 123",
+    "&#3221;&#3240;&#3277;",
+    "&amp;lt;b&amp;gt;ಕ",
+    "http://x<b>ಕ",
+    "http://a[1]ಕ ಖ",
+    "www.example.org/ಕನ್ನಡ ಪದ",
+    "<b <ref>ಕ</ref> ಖ",
+    "<ref name=a>ಕ<b>ಖ</b></ref>ಗ",
+    "<REF>ಕ</Ref>ಘ",
+    "==ಶೀರ್ಷಿಕೆ== ಪಠ್ಯ",
+    "== a <b> == ಕ ==",
+    "[೧] ಕ [12] ಖ [x]",
+    "ಕ  ಖ ಗ",
+    "ಕ‌ಖ‍ಗ",
+    "wwhttp://x ಕ",
+    "httpwww.x ಕ",
+    "<doc id=1> ಕ",
+    "ಕ&nbsp;ಖ&#160;ಗ",
+]
+
+def make_corpus(lines: int, seed: int = 0) -> List[str]:
+    """OCR-like mix of Kannada words, English, digits, punctuation and markup noise."""
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(KANNADA_LETTERS) for _ in range(rng.randint(2, 7))) for _ in range(2000)]
+    corpus = list(EDGE_CASES)
+    while len(corpus) < lines:
+        kind = rng.random()
+        if kind < 0.1:
+            # running header / page number / English-only line
+            corpus.append(f"{rng.choice(ENGLISH)} {rng.randint(1, 900)}")
+            continue
+        tokens = []
+        for _ in range(rng.randint(3, 14)):
+            r = rng.random()
+            if r < 0.75:
+                tokens.append(rng.choice(words))
+            elif r < 0.85:
+                tokens.append(rng.choice(ENGLISH))
+            elif r < 0.9:
+                tokens.append("".join(rng.choice(KANNADA_DIGITS) for _ in range(rng.randint(1, 3))))
+            elif r < 0.97:
+                tokens.append(rng.choice(NOISE))
+            else:
+                tokens.append(rng.choice(EDGE_CASES))
+        corpus.append(" ".join(tokens))
+    return corpus
+
+def check(corpus: List[str]) -> int:
+    for line in corpus:
+        expected = reference_clean_line(line)
+        got = clean_line(line)
+        if got != expected:
+            raise SystemExit(f"MISMATCH for {line!r}:\n  expected {expected!r}\n  got      {got!r}")
+    return len(corpus)
+
+def throughput(fn, corpus: List[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in corpus:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    return len(corpus) / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.lines, args.seed)
+    print(f"differential check: {check(corpus)} lines identical")
+
+    reference = throughput(reference_clean_line, corpus, args.repeat)
+    fused = throughput(clean_line, corpus, args.repeat)
+    print(f"reference cascade : {reference:12,.0f} lines/s")
+    print(f"clean_line        : {fused:12,.0f} lines/s  ({fused / reference:.2f}x)")
+
+    start = time.perf_counter()
+    kept = sum(1 for _ in clean_lines(corpus))
+    elapsed = time.perf_counter() - start
+    print(f"clean_lines       : {len(corpus) / elapsed:12,.0f} lines/s  (kept {kept})")
+
+if __name__ == "__main__":
+    main()
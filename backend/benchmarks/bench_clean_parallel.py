@@ -0,0 +1,61 @@
+"""
+clean_file vs clean_file_parallel throughput and scaling on a synthetic corpus file.
+
+    python benchmarks/bench_clean_parallel.py --mb 200 --workers 1 2 4 8
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_clean import make_corpus
+from utils.clean import clean_file, clean_file_parallel
+
+def write_corpus(path: str, mb: int) -> int:
+    """Write ~mb megabytes of OCR-like text with wiki-dump style <doc> markers."""
+    block = make_corpus(20000)
+    target = mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        doc = 0
+        while written < target:
+            text = f"<doc id=\"{doc}\">\n" + "\n".join(block) + "\n</doc>\n"
+            f.write(text)
+            written += len(text.encode("utf-8"))
+            doc += 1
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--chunk-mb", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "corpus.txt")
+        size = write_corpus(input_file, args.mb)
+        mb = size / (1024 * 1024)
+
+        expected = os.path.join(tmp, "sequential.txt")
+        start = time.perf_counter()
+        clean_file(input_file, expected)
+        baseline = time.perf_counter() - start
+        print(f"clean_file          : {baseline:7.2f}s  {mb / baseline:7.1f} MB/s")
+
+        for workers in sorted(set(args.workers)):
+            output = os.path.join(tmp, f"parallel_{workers}.txt")
+            start = time.perf_counter()
+            clean_file_parallel(input_file, output, workers, args.chunk_mb * 1024 * 1024)
+            elapsed = time.perf_counter() - start
+            same = filecmp.cmp(expected, output, shallow=False)
+            print(f"parallel workers={workers:<3}: {elapsed:7.2f}s  {mb / elapsed:7.1f} MB/s  "
+                  f"speedup {baseline / elapsed:5.2f}x  identical={same}")
+            os.remove(output)
+
+if __name__ == "__main__":
+    main()
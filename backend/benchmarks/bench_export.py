@@ -0,0 +1,88 @@
+"""
+export_pairs throughput per format/compression against a local Mongo stand-in.
+
+Requires benchmarks/requirements.txt. Uses an in-process mongomock-motor collection by default, or a real server with
+--mongo-url (the collection is created in a scratch database and dropped after).
+
+    python benchmarks/bench_export.py --docs 100000
+    python benchmarks/bench_export.py --mongo-url mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_clean import make_corpus
+from utils.export import export_pairs, ExportError
+
+SCENARIOS = [
+    ("jsonl", "none"),
+    ("jsonl", "gzip"),
+    ("jsonl", "zstd"),
+    ("parquet", "none"),
+    ("parquet", "zstd"),
+    ("arrow", "zstd"),
+]
+
+def make_pairs(docs: int, seed: int = 0):
+    lines = make_corpus(docs * 2, seed)
+    for i in range(docs):
+        yield {
+            "instruction": lines[2 * i],
+            "response": lines[2 * i + 1],
+            "translation_en": None,
+            "source": "json_upload" if i % 3 else "csv_upload",
+        }
+
+async def connect(mongo_url):
+    if mongo_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo_url)
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    return client, client["bench_export"].qa_pairs
+
+async def run(args):
+    client, collection = await connect(args.mongo_url)
+    try:
+        await collection.drop()
+        batch = []
+        for doc in make_pairs(args.docs, args.seed):
+            batch.append(doc)
+            if len(batch) >= 5000:
+                await collection.insert_many(batch)
+                batch = []
+        if batch:
+            await collection.insert_many(batch)
+        print(f"{args.docs} documents in {'mongodb' if args.mongo_url else 'mongomock'}")
+
+        for fmt, compression in SCENARIOS:
+            start = time.perf_counter()
+            size = 0
+            try:
+                async for chunk in export_pairs(collection, fmt, compression, batch_size=args.batch):
+                    size += len(chunk)
+            except ExportError as e:
+                print(f"{fmt:>7}/{compression:<5}: skipped ({e})")
+                continue
+            elapsed = time.perf_counter() - start
+            print(f"{fmt:>7}/{compression:<5}: {elapsed:6.2f}s  {args.docs / elapsed:10,.0f} docs/s  "
+                  f"{size / (1024 * 1024):8.1f} MB")
+    finally:
+        await collection.drop()
+        client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-url", default=None)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
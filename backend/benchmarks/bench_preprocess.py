@@ -0,0 +1,96 @@
+"""
+Per-page memory, latency and OCR accuracy of RGB vs grayscale rendering, with and
+without the NumPy preprocessing stage (utils/preprocess.py).
+
+Accuracy is word-level similarity to ground truth: the synthetic pages' own text,
+plus any tesstrain-style pairs (<name>.png + <name>.gt.txt) in --truth-dir.
+
+    python benchmarks/bench_preprocess.py --pages 10 --skew 3 --font /path/to/font.ttf
+"""
+import argparse
+import difflib
+import glob
+import os
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract
+from PIL import Image
+
+from benchmarks.synthetic import make_pdf, page_lines
+from utils.ocr import render_pages
+from utils.preprocess import preprocess_image
+
+def word_accuracy(truth: str, text: str) -> float:
+    return difflib.SequenceMatcher(None, truth.split(), text.split(), autojunk=False).ratio()
+
+def truth_pages(truth_dir: str) -> List[Tuple[str, str]]:
+    pairs = []
+    for image_path in sorted(glob.glob(os.path.join(truth_dir, "*.png"))):
+        truth_path = os.path.splitext(image_path)[0] + ".gt.txt"
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                pairs.append((image_path, f.read()))
+    return pairs
+
+def measure(images: List[Tuple[str, str]], preprocess: bool, lang: str, ocr: bool) -> dict:
+    decoded = prep = recog = accuracy = 0.0
+    for image_path, truth in images:
+        with Image.open(image_path) as image:
+            image.load()
+            start = time.perf_counter()
+            page = preprocess_image(image) if preprocess else image
+            prep += time.perf_counter() - start
+            # bytes Tesseract has to hold for the decoded page
+            decoded += len(page.tobytes())
+            if ocr:
+                start = time.perf_counter()
+                text = pytesseract.image_to_string(page, lang=lang)
+                recog += time.perf_counter() - start
+                accuracy += word_accuracy(truth, text)
+    n = len(images)
+    return {"decoded_mb": decoded / n / (1024 * 1024), "prep_ms": prep / n * 1000,
+            "ocr_ms": recog / n * 1000, "accuracy": accuracy / n}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--skew", type=float, default=3.0, help="max rotation of the synthetic scans")
+    parser.add_argument("--font", default=None, help="TTF font for the synthetic pages")
+    parser.add_argument("--lang", default="eng")
+    parser.add_argument("--truth-dir", default=None)
+    parser.add_argument("--no-ocr", action="store_true", help="only measure memory and preprocessing")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages, args.font, skew_degrees=args.skew)
+        truths = ["\n".join(lines) for lines in page_lines(args.pages)]
+        extra = truth_pages(args.truth_dir) if args.truth_dir else []
+
+        for grayscale in (False, True):
+            out_dir = os.path.join(tmp, "gray" if grayscale else "rgb")
+            os.makedirs(out_dir)
+            start = time.perf_counter()
+            rendered = [path for _, path, _ in render_pages(pdf_path, range(1, args.pages + 1), out_dir,
+                                                            dpi=args.dpi, grayscale=grayscale)]
+            render_ms = (time.perf_counter() - start) / args.pages * 1000
+            file_kb = sum(os.path.getsize(path) for path in rendered) / args.pages / 1024
+            images = list(zip(rendered, truths))
+            if grayscale:
+                images += extra
+
+            label = "gray" if grayscale else "rgb "
+            print(f"{label} render: {render_ms:7.1f} ms/pg  {file_kb:8.0f} KB/pg on disk")
+            for preprocess in ((False, True) if grayscale else (False,)):
+                r = measure(images, preprocess, args.lang, not args.no_ocr)
+                name = f"{label}{' + preprocess' if preprocess else '             '}"
+                print(f"  {name}: {r['decoded_mb']:6.2f} MB/pg decoded  prep {r['prep_ms']:6.1f} ms  "
+                      f"ocr {r['ocr_ms']:7.1f} ms  word accuracy {r['accuracy']:.3f}")
+
+if __name__ == "__main__":
+    main()
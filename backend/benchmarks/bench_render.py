@@ -0,0 +1,51 @@
+"""
+Per-page vs chunked PDF rasterization.
+
+    python benchmarks/bench_render.py --pages 60 --dpi 150
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf2image import convert_from_path
+
+from benchmarks.synthetic import make_pdf
+from utils.ocr import render_pages
+
+def per_page(pdf_path: str, pages: int, dpi: int) -> float:
+    """Old behaviour: one pdftoppm run (and one full PDF parse) per page."""
+    start = time.perf_counter()
+    for page_no in range(1, pages + 1):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no)
+        del images
+    return time.perf_counter() - start
+
+def chunked(pdf_path: str, pages: int, dpi: int, out_dir: str, chunk_pages: int) -> float:
+    start = time.perf_counter()
+    for _, image_path, _ in render_pages(pdf_path, range(1, pages + 1), out_dir, dpi=dpi, chunk_pages=chunk_pages):
+        if image_path:
+            os.remove(image_path)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = make_pdf(os.path.join(tmp, "synthetic.pdf"), args.pages)
+
+        elapsed = per_page(pdf_path, args.pages, args.dpi)
+        print(f"per-page      : {elapsed:7.2f}s  {args.pages / elapsed:6.1f} pg/s")
+        for chunk_pages in args.chunks:
+            elapsed = chunked(pdf_path, args.pages, args.dpi, tmp, chunk_pages)
+            print(f"chunk={chunk_pages:<3}     : {elapsed:7.2f}s  {args.pages / elapsed:6.1f} pg/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""
+End-to-end benchmark of the backend that runs offline, in one command: the API is
+driven in-process (httpx ASGI transport) against a mongomock-motor database, and
+books go from upload to completion through the real worker code on synthetic PDFs.
+Results are written as JSON; pass an earlier file as --baseline to print how every
+metric moved.
+
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python benchmarks/bench_suite.py --out baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --out after.json
+
+Scenarios: submit, upload, data, search, book_read (a seeded book read by page,
+line range, whole and revalidated), indexing (dedup + search index per page) and
+book (upload -> completion latency and OCR pages/sec). `book` needs poppler and
+tesseract with the kan and eng traineddata on PATH; it is skipped, with the reason
+in the results, when they are missing. Kannada pages need --font with a Kannada TTF.
+
+mongomock keeps no indexes: every lookup and upsert scans its collection, so the
+database-heavy numbers grow with the data sizes. Only compare runs made with the
+same arguments (they are saved in the results).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.bench_clean import make_corpus
+from benchmarks.bench_export import make_pairs
+from benchmarks.synthetic import make_pdf
+
+SCENARIOS = ["submit", "upload", "data", "search", "book_read", "indexing", "book"]
+
+def latency_stats(seconds: List[float]) -> dict:
+    ms = sorted(s * 1000 for s in seconds)
+    if not ms:
+        return {}
+    pick = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+    return {"requests": len(ms), "mean_ms": round(statistics.fmean(ms), 3), "p50_ms": round(pick(0.5), 3),
+            "p95_ms": round(pick(0.95), 3), "p99_ms": round(pick(0.99), 3)}
+
+async def timed(call) -> float:
+    start = time.perf_counter()
+    response = await call
+    elapsed = time.perf_counter() - start
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.method} {response.request.url}: "
+                           f"{response.status_code} {response.text[:200]}")
+    return elapsed
+
+async def run_concurrently(calls: List[Callable], concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with semaphore:
+            return await timed(call())
+
+    return await asyncio.gather(*(one(call) for call in calls))
+
+# ---------------- scenarios ----------------
+
+async def bench_submit(client, args) -> dict:
+    pairs = list(make_pairs(args.submits, args.seed))
+    start = time.perf_counter()
+    latencies = await run_concurrently([lambda pair=pair: client.post("/api/submit", json=pair)
+                                        for pair in pairs], args.concurrency)
+    elapsed = time.perf_counter() - start
+    return {"requests_per_s": round(len(pairs) / elapsed, 1), **latency_stats(latencies)}
+
+async def bench_upload(client, args) -> dict:
+    body = "".join(json.dumps(pair, ensure_ascii=False) + "\n"
+                   for pair in make_pairs(args.upload_pairs, args.seed + 1)).encode("utf-8")
+    start = time.perf_counter()
+    response = await client.post("/api/upload", files={"file": ("pairs.jsonl", body, "application/json")})
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    return {"pairs": args.upload_pairs, "accepted": response.json()["accepted"], "seconds": round(elapsed, 3),
+            "pairs_per_s": round(args.upload_pairs / elapsed, 1),
+            "mb_per_s": round(len(body) / elapsed / (1024 * 1024), 2)}
+
+async def bench_data(client, args) -> dict:
+    latencies = []
+    cursor = None
+    for _ in range(args.data_pages):
+        params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+        start = time.perf_counter()
+        response = await client.get("/api/data", params=params)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    return latency_stats(latencies)
+
+async def bench_search(client, args) -> dict:
+    import main
+    from utils.search import tokenize
+    # pairs stored by the earlier scenarios are indexed in the background
+    await main.index_queue.join()
+    rng = random.Random(args.seed)
+    words = [w for pair in make_pairs(200, args.seed) for w in tokenize(pair["instruction"])]
+    queries = [rng.choice(words) for _ in range(args.queries // 2)]
+    queries += [" ".join(rng.sample(words, 2)) for _ in range(args.queries // 4)]
+    queries += [rng.choice(words)[:3] for _ in range(args.queries - len(queries))]   # prefixes
+    hits = []
+
+    async def search(query):
+        response = await client.get("/api/search", params={"q": query, "limit": 20})
+        hits.append(len(response.json().get("results", [])))
+        return response
+
+    latencies = [await timed(search(query)) for query in queries]
+    return {"mean_results": round(statistics.fmean(hits), 1), **latency_stats(latencies)}
+
+async def seed_book(books_db, book_id: str, pages: int, seed: int) -> List[List[str]]:
+    """A completed book stored the way the worker stores one, without any OCR."""
+    from utils.clean import clean_lines
+    corpus = make_corpus(pages * 40, seed)
+    texts = [list(clean_lines(corpus[i * 40:(i + 1) * 40])) for i in range(pages)]
+    line_index = []
+    first_line = 0
+    for page_no, lines in enumerate(texts, start=1):
+        line_index.append([page_no, first_line, len(lines)])
+        first_line += len(lines)
+    await books_db.book_pages.insert_many([
+        {"_id": f"{book_id}:{page_no:05d}", "book_id": book_id, "page": page_no, "ok": True,
+         "text": "\n".join(lines), "kept_lines": len(lines), "dup_lines": []}
+        for page_no, lines in enumerate(texts, start=1)
+    ])
+    await books_db.books.insert_one({
+        "_id": book_id, "filename": "seeded.pdf", "status": "completed", "pages": pages,
+        "kept_lines": first_line, "line_index": line_index, "processed_at": str(datetime.now()),
+    })
+    return texts
+
+async def bench_book_read(client, args) -> dict:
+    from database import db
+    book_id = "bench-seeded"
+    await seed_book(db.get_books_db(), book_id, args.book_pages_seeded, args.seed)
+    url = f"/api/books/{book_id}"
+    gzip_headers = {"Accept-Encoding": "gzip"}
+    rng = random.Random(args.seed)
+    results = {}
+
+    async def measure(name, calls):
+        latencies = [await timed(call()) for call in calls]
+        results[name] = latency_stats(latencies)
+
+    await measure("page", [lambda p=rng.randint(1, args.book_pages_seeded): client.get(url, params={"page": p})
+                           for _ in range(args.reads)])
+    await measure("range", [lambda o=rng.randint(0, 1000): client.get(url, params={"offset": o, "limit": 200})
+                            for _ in range(args.reads)])
+    await measure("whole", [lambda: client.get(url, headers=gzip_headers) for _ in range(max(1, args.reads // 10))])
+    whole = await client.get(url, headers=gzip_headers)
+    plain = await client.get(url, headers={"Accept-Encoding": "identity"})
+    etag = whole.headers["etag"]
+    await measure("not_modified", [lambda: client.get(url, headers={"If-None-Match": etag})
+                                   for _ in range(args.reads)])
+    results["whole_bytes"] = len(plain.content)
+    results["whole_gzip_bytes"] = int(whole.headers.get("content-length", len(whole.content)))
+    return results
+
+async def bench_indexing(client, args) -> dict:
+    from database import db
+    from utils.dedup import DedupIndex
+    from utils.search import SearchIndex
+    books_db = db.get_books_db()
+    book_id = "bench-indexed"
+    texts = await seed_book(books_db, book_id, args.index_pages, args.seed + 2)
+    dedup = DedupIndex(books_db)
+    start = time.perf_counter()
+    duplicates = 0
+    for page_no, lines in enumerate(texts, start=1):
+        duplicates += len(await dedup.check_page(book_id, "bench", page_no, lines))
+    dedup_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    await SearchIndex(books_db).index_book(book_id)
+    search_seconds = time.perf_counter() - start
+    lines = sum(len(lines) for lines in texts)
+    return {"pages": len(texts), "lines": lines, "duplicate_lines": duplicates,
+            "dedup_pages_per_s": round(len(texts) / dedup_seconds, 1),
+            "search_index_pages_per_s": round(len(texts) / search_seconds, 1)}
+
+def missing_ocr_tools() -> Optional[str]:
+    for tool in ("pdftoppm", "pdfinfo", "tesseract"):
+        if shutil.which(tool) is None:
+            return f"{tool} not found on PATH"
+    return None
+
+async def bench_book(client, args) -> dict:
+    missing = missing_ocr_tools()
+    if missing:
+        return {"skipped": missing}
+    from database import db
+    from jobs import job_queue
+    from utils.ocr import LANG
+    from utils.scheduler import scheduler
+    from worker import run_job
+
+    if args.script != "latin" and not args.font:
+        return {"skipped": "--script kannada/mixed needs --font with a Kannada TTF"}
+    pdf_path = make_pdf(os.path.join(args.workdir, "synthetic.pdf"), args.book_pages, args.font,
+                        args.seed, script=args.script)
+    with open(pdf_path, "rb") as f:
+        pdf = f.read()
+
+    scheduler.start(LANG, args.ocr_workers)
+    runs = []
+    try:
+        for _ in range(args.books):
+            start = time.perf_counter()
+            response = await client.post("/api/books/upload",
+                                         files={"file": ("synthetic.pdf", pdf, "application/pdf")})
+            response.raise_for_status()
+            uploaded = time.perf_counter() - start
+            book_id = response.json()["book_id"]
+            job = await job_queue.lease("bench")
+            await run_job(job, "bench")
+            total = time.perf_counter() - start
+            book = await db.get_books_db().books.find_one({"_id": book_id})
+            if book.get("status") != "completed":
+                return {"failed": book.get("error", book.get("status"))}
+            runs.append({"upload_s": uploaded, "total_s": total, "timings": book.get("timings", {})})
+    finally:
+        scheduler.close()
+
+    ocr_seconds = statistics.fmean(run["total_s"] - run["upload_s"] for run in runs)
+    stages = {stage: round(statistics.fmean(run["timings"].get(stage, 0.0) for run in runs), 3)
+              for stage in runs[0]["timings"]}
+    return {"books": len(runs), "pages": args.book_pages, "upload_ms": round(statistics.fmean(
+                run["upload_s"] for run in runs) * 1000, 1),
+            "upload_to_completed_seconds": round(statistics.fmean(run["total_s"] for run in runs), 3),
+            "ocr_pages_per_s": round(args.book_pages / ocr_seconds, 3), "stage_seconds": stages}
+
+# ---------------- reporting ----------------
+
+def flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+def compare(baseline: dict, current: dict):
+    """Print every metric present in both runs; rates are better higher, times lower."""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    changed = sorted(key for key in set(baseline.get("args", {})) | set(current["args"])
+                     if key not in ("out", "baseline")
+                     and baseline.get("args", {}).get(key) != current["args"].get(key))
+    if changed:
+        print(f"\nwarning: runs used different arguments ({', '.join(changed)}); sizes affect the numbers")
+    print(f"\n{'metric':<48}{'baseline':>14}{'current':>14}{'change':>10}")
+    for name in sorted(set(old) & set(new)):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        if name.endswith("_per_s"):
+            better = change > 0
+        elif name.endswith(("_ms", "_s", "seconds")) or ".stage_seconds." in name:
+            better = change < 0
+        else:
+            better = None
+        mark = "" if better is None or abs(change) < 5 else (" +" if better else " -")
+        print(f"{name:<48}{old[name]:>14,.3f}{new[name]:>14,.3f}{change:>9.1f}%{mark}")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+async def run(args) -> dict:
+    import httpx
+    from mongomock_motor import AsyncMongoMockClient
+    from database import db
+    import main
+
+    db.client = AsyncMongoMockClient()
+    transport = httpx.ASGITransport(app=main.app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.scenarios:
+            print(f"running {name} ...", flush=True)
+            start = time.perf_counter()
+            results[name] = await globals()[f"bench_{name}"](client, args)
+            print(f"  {json.dumps(results[name])}  ({time.perf_counter() - start:.1f}s)")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--submits", type=int, default=300)
+    parser.add_argument("--upload-pairs", type=int, default=2000)
+    parser.add_argument("--data-pages", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=100)
+    parser.add_argument("--book-pages-seeded", type=int, default=100, help="pages of the book_read book")
+    parser.add_argument("--index-pages", type=int, default=20, help="pages run through the indexing scenario")
+    parser.add_argument("--books", type=int, default=1, help="synthetic books OCR'd in the book scenario")
+    parser.add_argument("--book-pages", type=int, default=10)
+    parser.add_argument("--ocr-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--script", choices=["latin", "kannada", "mixed"], default="latin")
+    parser.add_argument("--font", default=None, help="TTF font for the synthetic pages")
+    args = parser.parse_args()
+    out_path = os.path.abspath(args.out)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    font = os.path.abspath(args.font) if args.font else None
+
+    # uploads/, the OCR cache and the corpus artifact all live under the working
+    # directory: use a scratch one so runs start cold and leave nothing behind
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as workdir:
+        os.chdir(workdir)
+        args.workdir, args.font = workdir, font
+        os.environ.setdefault("BOOK_WORKERS", "0")
+        os.environ.setdefault("LOG_FORMAT", "text")
+        results = asyncio.run(run(args))
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count()},
+        "args": {key: value for key, value in vars(args).items() if key != "workdir"},
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nResults written to {out_path}")
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
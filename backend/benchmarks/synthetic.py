@@ -0,0 +1,55 @@
+import random
+from typing import List, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+# ---------------- CONFIG ----------------
+PAGE_SIZE = (1240, 1754)    # A4 at 150 DPI
+LINES_PER_PAGE = 40
+WORDS = ["tulu", "kannada", "book", "page", "line", "text", "scan", "corpus", "model", "data"]
+# Kannada words (tulu, language, book, page, line, kannada, town, house, story, word);
+# drawing them needs a Kannada font
+KANNADA_WORDS = ["\u0CA4\u0CC1\u0CB3\u0CC1", "\u0CAD\u0CBE\u0CB7\u0CC6", "\u0CAA\u0CC1\u0CB8\u0CCD\u0CA4\u0C95", "\u0CAA\u0CC1\u0C9F",
+                 "\u0CB8\u0CBE\u0CB2\u0CC1", "\u0C95\u0CA8\u0CCD\u0CA8\u0CA1", "\u0C8A\u0CB0\u0CC1", "\u0CAE\u0CA8\u0CC6",
+                 "\u0C95\u0CA4\u0CC6", "\u0CAA\u0CA6"]
+# ----------------------------------------
+
+def page_lines(pages: int, seed: int = 0, script: str = "latin") -> List[List[str]]:
+    """
+    The text drawn on each synthetic page (ground truth for accuracy checks), in
+    `script` "latin", "kannada" or "mixed" (Kannada words with English ones).
+    """
+    rng = random.Random(seed)
+    words = {"latin": WORDS, "kannada": KANNADA_WORDS, "mixed": KANNADA_WORDS * 3 + WORDS}[script]
+    return [[f"Page {page_no}"] + [" ".join(rng.choice(words) for _ in range(10)) for _ in range(LINES_PER_PAGE)]
+            for page_no in range(1, pages + 1)]
+
+def make_pages(pages: int, font_path: Optional[str] = None, seed: int = 0,
+               skew_degrees: float = 0.0, script: str = "latin") -> List[Image.Image]:
+    """
+    Draw `pages` scan-like grayscale pages with random word lines, each rotated by up
+    to `skew_degrees` like a crooked scan.
+    """
+    font = ImageFont.truetype(font_path, 28) if font_path else ImageFont.load_default()
+    skew = random.Random(seed + 1)
+    images = []
+    for lines in page_lines(pages, seed, script):
+        image = Image.new("L", PAGE_SIZE, color=255)
+        draw = ImageDraw.Draw(image)
+        draw.text((100, 60), lines[0], fill=0, font=font)
+        for i, line in enumerate(lines[1:]):
+            draw.text((100, 120 + i * 38), line, fill=0, font=font)
+        if skew_degrees:
+            image = image.rotate(skew.uniform(-skew_degrees, skew_degrees), resample=Image.BILINEAR,
+                                 fillcolor=255)
+        images.append(image)
+    return images
+
+def make_pdf(path: str, pages: int, font_path: Optional[str] = None, seed: int = 0,
+             skew_degrees: float = 0.0, script: str = "latin") -> str:
+    """
+    Write a synthetic multi-page scanned PDF to `path`. Returns the path.
+    """
+    images = make_pages(pages, font_path=font_path, seed=seed, skew_degrees=skew_degrees, script=script)
+    images[0].save(path, "PDF", resolution=150.0, save_all=True, append_images=images[1:])
+    return path
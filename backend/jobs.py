@@ -0,0 +1,173 @@
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+
+from database import db
+
+# ---------------- CONFIG ----------------
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))      # a job is orphaned once its lease lapses
+HEARTBEAT_SECONDS = LEASE_SECONDS // 4
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = 30                                      # doubled on every further attempt
+# lease order within a priority: a book counts as queued this many seconds later per page,
+# so short books overtake long ones queued shortly before them, and a long book still
+# comes up once it has waited its length out
+SECONDS_PER_PAGE = float(os.getenv("JOB_SECONDS_PER_PAGE", "2"))
+# ----------------------------------------
+
+STATUSES = ("queued", "running", "completed", "failed")
+
+class JobQueue:
+    """
+    Durable book-processing queue stored in the `jobs` collection of textfrombooks.
+    Workers lease a job, keep the lease alive with heartbeats, and complete or fail
+    it. A job whose lease expires (worker crashed or restarted) is leased again.
+    Jobs are leased by priority, then by `rank`: the enqueue time pushed back by
+    SECONDS_PER_PAGE for every page of the book.
+    Pass `collection` to run against a stand-in such as mongomock-motor.
+    """
+
+    def __init__(self, collection=None):
+        self._collection = collection
+
+    @property
+    def collection(self):
+        if self._collection is not None:
+            return self._collection
+        return db.get_books_db().jobs
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("status", ASCENDING), ("priority", DESCENDING), ("run_after", ASCENDING)]
+        )
+        await self.collection.create_index([("priority", DESCENDING), ("rank", ASCENDING)])
+        await self.collection.create_index([("book_id", ASCENDING)])
+
+    async def enqueue(self, book_id: str, file_path: str, filename: str,
+                      priority: int = 0, total_pages: Optional[int] = None, **params) -> str:
+        """`total_pages` (pages to OCR, when known) places the job in the lease order."""
+        now = datetime.utcnow()
+        job = {
+            "book_id": book_id,
+            "file_path": file_path,
+            "filename": filename,
+            "params": params,
+            "priority": priority,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": MAX_ATTEMPTS,
+            "total_pages": total_pages,
+            "created_at": now,
+            "rank": now + timedelta(seconds=SECONDS_PER_PAGE * (total_pages or 0)),
+            "run_after": now,
+        }
+        result = await self.collection.insert_one(job)
+        return str(result.inserted_id)
+
+    async def lease(self, worker_id: str) -> Optional[dict]:
+        """Claim the next runnable job (queued, or running with an expired lease)."""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "started_at": now,
+                    "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", DESCENDING), ("rank", ASCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def heartbeat(self, job: dict, worker_id: str) -> bool:
+        """Extend the lease. False means another worker has taken the job over."""
+        result = await self.collection.update_one(
+            {"_id": job["_id"], "status": "running", "worker_id": worker_id},
+            {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}},
+        )
+        return result.modified_count == 1
+
+    async def complete(self, job: dict, worker_id: str):
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker_id": worker_id},
+            {"$set": {"status": "completed", "finished_at": datetime.utcnow()},
+             "$unset": {"lease_until": ""}},
+        )
+
+    async def fail(self, job: dict, worker_id: str, error: str) -> bool:
+        """
+        Record a failed attempt. Returns True if the job was re-queued for a retry,
+        False if it has used up its attempts.
+        """
+        now = datetime.utcnow()
+        attempts = job.get("attempts", 1)
+        if attempts < job.get("max_attempts", MAX_ATTEMPTS):
+            delay = RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+            await self.collection.update_one(
+                {"_id": job["_id"], "worker_id": worker_id},
+                {"$set": {"status": "queued", "error": error,
+                          "run_after": now + timedelta(seconds=delay)},
+                 "$unset": {"lease_until": "", "worker_id": ""}},
+            )
+            return True
+
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker_id": worker_id},
+            {"$set": {"status": "failed", "error": error, "finished_at": now},
+             "$unset": {"lease_until": ""}},
+        )
+        return False
+
+    async def recover_orphans(self) -> int:
+        """
+        Startup recovery. Running jobs with lapsed leases go back to the queue, and
+        books stuck in `processing` with no live job (e.g. uploaded before the queue
+        existed) get a job if their upload is still on disk, else are marked failed.
+        Returns the number of jobs re-queued or created.
+        """
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            {"status": "running", "lease_until": {"$lt": now}},
+            {"$set": {"status": "queued", "run_after": now},
+             "$unset": {"lease_until": "", "worker_id": ""}},
+        )
+        recovered = result.modified_count
+
+        books = db.get_books_db().books
+        async for book in books.find({"status": "processing"}, {"filename": 1, "file_path": 1}):
+            live = await self.collection.find_one(
+                {"book_id": book["_id"], "status": {"$in": ["queued", "running"]}}, {"_id": 1}
+            )
+            if live:
+                continue
+            file_path = book.get("file_path")
+            if file_path and os.path.exists(file_path):
+                await self.enqueue(book["_id"], file_path, book["filename"])
+                recovered += 1
+            else:
+                await books.update_one(
+                    {"_id": book["_id"]},
+                    {"$set": {"status": "failed", "error": "Upload lost before processing"}},
+                )
+
+        if recovered:
+            print(f"Recovered {recovered} orphaned book jobs")
+        return recovered
+
+    async def counts(self) -> dict:
+        """Jobs per status; every status is present, so one that empties reads 0."""
+        counts = dict.fromkeys(STATUSES, 0)
+        cursor = self.collection.aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}])
+        async for row in cursor:
+            counts[row["_id"]] = row["n"]
+        return counts
+
+job_queue = JobQueue()
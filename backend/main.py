@@ -1,20 +1,34 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request, Response
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from typing import List, Optional
 from contextlib import asynccontextmanager
-import json
-import codecs
-import codecs
+import asyncio
 import os
-import shutil
+import json
+import time
+import base64
+import hashlib
+import multiprocessing
 from database import db
-from fastapi import BackgroundTasks
-from utils.ocr import ocr_book_with_parallel_pages
-from utils.clean import clean_text, clean_file
+from jobs import job_queue
+from utils.ingest import parser_for, normalize_pair, content_hash
+from utils.corpus import (iter_book_text, refresh_corpus, parse_range, iter_file_range,
+                          read_book_page, read_book_lines, ARTIFACT_NAME)
+from utils.responses import json_response, etag_matches, not_modified
+from utils.upload import stream_upload, DiskSink, GridFSSink, UploadError
+from utils.search import search_index
+from utils.metrics import metrics, merge as merge_metrics, render as render_metrics
+from utils.export import export_pairs, check_export_args, export_filename, ExportError, MEDIA_TYPES
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from worker import UPLOAD_FOLDER, main as worker_main
+from utils.ocr import pdf_page_count
 from motor.motor_asyncio import AsyncIOMotorGridFSBucket
 from bson import ObjectId
+from datetime import datetime, timedelta
 
 # Data Models
 class Translation(BaseModel):
@@ -30,17 +44,56 @@ class QAPair(BaseModel):
 class QAPairResponse(QAPair):
     id: str
 
+class QAPairListItem(BaseModel):
+    # every field but id is optional so /api/data can return projections
+    id: str
+    instruction: Optional[str] = None
+    response: Optional[str] = None
+    translation_en: Optional[Translation] = None
+    source: Optional[str] = None
+
 # App Lifecycle
+BOOK_WORKERS = int(os.getenv("BOOK_WORKERS", "1"))  # 0 = run `python worker.py` separately
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     db.connect()
+    # partial: documents from before deduplication have no hash until backfilled
+    await db.get_db().qa_pairs.create_index(
+        "content_hash", unique=True, partialFilterExpression={"content_hash": {"$exists": True}}
+    )
+    # keyset pages filtered by source
+    await db.get_db().qa_pairs.create_index([("source", 1), ("_id", -1)])
+    await job_queue.ensure_indexes()
+    await search_index.ensure_indexes()
+    await job_queue.recover_orphans()
+
+    # OCR runs in separate worker processes so the API stays responsive; not daemonic,
+    # since a daemon may not start the OCR pool's own processes (they are stopped below)
+    workers = []
+    for _ in range(BOOK_WORKERS):
+        process = multiprocessing.get_context("spawn").Process(target=worker_main, daemon=False)
+        process.start()
+        workers.append(process)
+
     yield
+
+    for process in workers:
+        process.terminate()
+    for process in workers:
+        process.join(timeout=10)
+    if _index_task is not None and not _index_task.done():
+        # index what is queued; anything left over is caught up by --rebuild
+        await index_queue.put(None)
+        try:
+            await asyncio.wait_for(_index_task, timeout=30)
+        except asyncio.TimeoutError:
+            print("Search indexing did not finish before shutdown")
     db.close()
 
 app = FastAPI(lifespan=lifespan)
 
 # CORS Setup
-UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 origins = [
@@ -53,8 +106,50 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # route template, not the raw path, so ids do not explode the label set
+        route = request.scope.get("route")
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                        method=request.method, route=route.path if route else "unmatched", status=status)
+
+INDEX_QUEUE_BATCHES = 100   # pair batches waiting for the search index before requests wait on it
+
+# new pairs are indexed by a background task, not in the request that stored them
+index_queue: asyncio.Queue = asyncio.Queue(maxsize=INDEX_QUEUE_BATCHES)
+_index_task: Optional[asyncio.Task] = None
+
+async def _index_pairs_forever():
+    while True:
+        pairs = await index_queue.get()
+        try:
+            if pairs is None:
+                return
+            await search_index.index_pairs(pairs)
+        except Exception as e:
+            # the pairs are stored either way: `python -m utils.search --rebuild` catches up
+            print(f"Error indexing pairs: {e}")
+        finally:
+            index_queue.task_done()
+
+async def index_new_pairs(pairs: List[dict]):
+    global _index_task
+    if not pairs:
+        return
+    if _index_task is None or _index_task.done():
+        _index_task = asyncio.create_task(_index_pairs_forever())
+    await index_queue.put(pairs)
+
 # Endpoints
 
 @app.get("/")
@@ -65,161 +160,228 @@ async def root():
 async def submit_qa_pair(qa: QAPair):
     try:
         data = qa.dict()
-        result = await db.get_db().qa_pairs.insert_one(data)
-        return {"id": str(result.inserted_id), "message": "Submitted successfully"}
+        data["content_hash"] = content_hash(data["instruction"], data["response"])
+        collection = db.get_db().qa_pairs
+        result = await collection.update_one(
+            {"content_hash": data["content_hash"]}, {"$setOnInsert": data}, upsert=True
+        )
+        if result.upserted_id is None:
+            existing = await collection.find_one({"content_hash": data["content_hash"]}, {"_id": 1})
+            return {"id": str(existing["_id"]), "message": "This pair was already submitted", "duplicate": True}
+        await index_new_pairs([{**data, "_id": result.upserted_id}])
+        return {"id": str(result.upserted_id), "message": "Submitted successfully"}
     except Exception as e:
         print(f"Error submitting data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+INGEST_CHUNK_BYTES = 1024 * 1024   # upload bytes parsed per read
+INGEST_BATCH = 1000                # documents per bulk upsert
+
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
+    parser, source = parser_for(file.filename or "")
+    if parser is None:
+        raise HTTPException(status_code=400, detail="Unsupported file format. Use .json, .jsonl or .csv")
+
+    collection = db.get_db().qa_pairs
+    batches = []
+    pending = {}        # content_hash -> document, so repeats inside a batch collapse
+    rejected = 0
+    duplicates = 0
+
+    async def flush():
+        nonlocal pending, rejected, duplicates
+        if not pending and not rejected and not duplicates:
+            return
+        inserted = 0
+        if pending:
+            # upsert on the unique content_hash: existing pairs are matched, not re-inserted
+            docs = list(pending.values())
+            ops = [UpdateOne({"content_hash": doc["content_hash"]}, {"$setOnInsert": doc}, upsert=True)
+                   for doc in docs]
+            try:
+                result = await collection.bulk_write(ops, ordered=False)
+                inserted = result.upserted_count
+                duplicates += result.matched_count
+                upserted = result.upserted_ids.items()
+            except BulkWriteError as bwe:
+                inserted = bwe.details.get("nUpserted", 0)
+                upserted = [(u["index"], u["_id"]) for u in bwe.details.get("upserted", [])]
+                duplicates += bwe.details.get("nMatched", 0)
+                for error in bwe.details.get("writeErrors", []):
+                    # a concurrent upload inserted the same pair first
+                    if error.get("code") == 11000:
+                        duplicates += 1
+                    else:
+                        rejected += 1
+            await index_new_pairs([{**docs[i], "_id": _id} for i, _id in upserted])
+        batches.append({"batch": len(batches) + 1, "accepted": inserted,
+                        "duplicates": duplicates, "rejected": rejected})
+        pending = {}
+        rejected = 0
+        duplicates = 0
+
+    def summary() -> dict:
+        return {
+            "accepted": sum(b["accepted"] for b in batches),
+            "duplicates": sum(b["duplicates"] for b in batches),
+            "rejected": sum(b["rejected"] for b in batches),
+            "batches": batches,
+        }
+
     try:
-        contents = await file.read()
-        decoded = codecs.decode(contents, "utf-8")
-        
-        items_to_insert = []
-        
-        if file.filename.endswith('.json'):
+        while True:
+            chunk = await file.read(INGEST_CHUNK_BYTES)
             try:
-                data = json.loads(decoded)
-                if isinstance(data, list):
-                    for item in data:
-                        # Validate and normalize
-                        if "instruction" in item and "response" in item:
-                            items_to_insert.append({
-                                "instruction": item["instruction"],
-                                "response": item["response"],
-                                "translation_en": item.get("translation_en"),
-                                "source": "json_upload"
-                            })
-                elif isinstance(data, dict):
-                     if "instruction" in data and "response" in data:
-                            items_to_insert.append({
-                                "instruction": data["instruction"],
-                                "response": data["response"],
-                                "translation_en": data.get("translation_en"),
-                                "source": "json_upload"
-                            })
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid JSON format")
-                
-        elif file.filename.endswith('.csv'):
-            import csv
-            import io
-            csv_reader = csv.DictReader(io.StringIO(decoded))
-            for row in csv_reader:
-                # Flexible column matching for CSV
-                instruction = row.get('instruction') or row.get('question') or row.get('q')
-                response = row.get('response') or row.get('answer') or row.get('a')
-                
-                if instruction and response:
-                    items_to_insert.append({
-                        "instruction": instruction,
-                        "response": response,
-                        "source": "csv_upload"
-                    })
-        else:
-             raise HTTPException(status_code=400, detail="Unsupported file format. Use .json or .csv")
-        
-        if items_to_insert:
-            result = await db.get_db().qa_pairs.insert_many(items_to_insert)
-            return {"message": f"Successfully uploaded {len(result.inserted_ids)} pairs"}
+                rows = parser.feed(chunk) if chunk else parser.close()
+            except ValueError as ve:
+                await flush()
+                detail = {"message": f"Invalid {source.split('_')[0].upper()} format: {ve}", **summary()}
+                raise HTTPException(status_code=400, detail=detail)
+
+            for row in rows:
+                item = normalize_pair(row, source)
+                if item is None:
+                    rejected += 1
+                    continue
+                if item["content_hash"] in pending:
+                    duplicates += 1
+                    continue
+                pending[item["content_hash"]] = item
+                if len(pending) >= INGEST_BATCH:
+                    await flush()
+            if not chunk:
+                break
+        await flush()
+
+        stats = summary()
+        if stats["accepted"]:
+            message = f"Successfully uploaded {stats['accepted']} pairs"
+            if stats["duplicates"]:
+                message += f" ({stats['duplicates']} duplicates skipped)"
+        elif stats["duplicates"]:
+            message = f"All {stats['duplicates']} pairs were already uploaded"
         else:
-            return {"message": "No valid pairs found in file"}
-            
+            message = "No valid pairs found in file"
+        return {"message": message, **stats}
+
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Error processing file: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
-@app.get("/api/data", response_model=List[QAPairResponse])
-async def get_data():
+DATA_PAGE_SIZE = 100
+DATA_MAX_PAGE_SIZE = 1000
+DATA_FIELDS = ("instruction", "response", "translation_en", "source")
+
+def encode_cursor(object_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(object_id.binary).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> ObjectId:
     try:
-        cursor = db.get_db().qa_pairs.find().limit(100).sort("_id", -1)
+        return ObjectId(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/data", response_model=List[QAPairListItem], response_model_exclude_unset=True)
+async def get_data(
+    response: Response,
+    limit: int = Query(DATA_PAGE_SIZE, ge=1, le=DATA_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    source: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of " + ",".join(DATA_FIELDS)),
+):
+    """
+    Newest-first QA pairs, paged by _id (keyset, so every page costs the same).
+    Pass the X-Next-Cursor header of one page as `cursor` to get the next; the
+    header is absent on the last page.
+    """
+    wanted = DATA_FIELDS
+    if fields:
+        wanted = tuple(f for f in DATA_FIELDS if f in {x.strip() for x in fields.split(",")})
+        if not wanted:
+            raise HTTPException(status_code=400, detail=f"fields must be among {', '.join(DATA_FIELDS)}")
+
+    query = {}
+    if source:
+        query["source"] = source
+    if cursor:
+        query["_id"] = {"$lt": decode_cursor(cursor)}
+
+    projection = {field: 1 for field in wanted}
+    if "instruction" in wanted:
+        projection["question"] = 1
+    if "response" in wanted:
+        projection["answer"] = 1
+
+    try:
+        documents = await db.get_db().qa_pairs.find(query, projection) \
+            .sort("_id", -1).limit(limit + 1).to_list(length=limit + 1)
+        if len(documents) > limit:
+            documents = documents[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(documents[-1]["_id"])
+
         results = []
-        async for document in cursor:
-            results.append(QAPairResponse(
-                id=str(document["_id"]),
-                instruction=document.get("instruction", document.get("question", "")), # Fallback for old data
-                response=document.get("response", document.get("answer", "")),       # Fallback for old data
-                translation_en=document.get("translation_en"),
-                source=document.get("source", "unknown")
-            ))
+        for document in documents:
+            item = {"id": str(document["_id"])}
+            if "instruction" in wanted:
+                item["instruction"] = document.get("instruction", document.get("question", ""))  # Fallback for old data
+            if "response" in wanted:
+                item["response"] = document.get("response", document.get("answer", ""))         # Fallback for old data
+            if "translation_en" in wanted:
+                item["translation_en"] = document.get("translation_en")
+            if "source" in wanted:
+                item["source"] = document.get("source", "unknown")
+            results.append(QAPairListItem(**item))
         return results
     except Exception as e:
         print(f"Error fetching data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/export")
+async def export_data(
+    format: str = "jsonl",
+    compression: str = "none",
+    source: Optional[str] = None,
+    since_id: Optional[str] = None,
+):
+    """
+    Stream the whole qa_pairs collection (optionally only `source`, or only pairs
+    newer than `since_id`) as JSONL, Parquet or Arrow, compressed on the fly.
+    """
+    try:
+        check_export_args(format, compression, since_id)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        export_pairs(db.get_db().qa_pairs, format, compression, source, since_id),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename={export_filename(format, compression)}"}
+    )
+
 # Book Upload & Processing
 
-def process_book_background(file_path: str, filename: str, book_id: str):
-    ocr_output_path = os.path.join(UPLOAD_FOLDER, f"{book_id}_ocr.txt")
-    cleaned_output_path = os.path.join(UPLOAD_FOLDER, f"{book_id}_cleaned.txt")
-    
+SEARCH_MAX_LIMIT = 100
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    kind: Optional[str] = Query(None, description="book or qa"),
+    book_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+):
+    """
+    Book pages and QA pairs containing every word of `q` (as a word or a word
+    prefix), best first, with the line numbers and text of the matching lines.
+    """
+    if kind not in (None, "book", "qa"):
+        raise HTTPException(status_code=400, detail="kind must be 'book' or 'qa'")
     try:
-        # 1. OCR
-        print(f"Starting OCR for {filename}...")
-        success = ocr_book_with_parallel_pages(file_path, ocr_output_path)
-        
-        if not success:
-             print(f"OCR failed for {filename}")
-             db.get_books_db().books.update_one(
-                {"_id": book_id},
-                {"$set": {"status": "failed", "error": "OCR failed"}}
-             )
-             # Cleanup
-             if os.path.exists(file_path):
-                os.remove(file_path)
-             if os.path.exists(ocr_output_path):
-                os.remove(ocr_output_path)
-             print(f"OCR failed for {filename}. Cleanup complete.")
-             return
-
-        # 2. Clean
-        print(f"Starting cleaning for {filename}...")
-        
-        kept_lines = clean_file(ocr_output_path, cleaned_output_path)
-        
-        # Read cleaned content
-        with open(cleaned_output_path, "r", encoding="utf-8") as f:
-            cleaned_content = f.read()
-            
-        print(f"Cleaning complete for {filename}. Kept {kept_lines} lines. Content length: {len(cleaned_content)}")
-
-        # 3. Store in DB
-        db.get_books_db().books.update_one(
-            {"_id": book_id},
-            {"$set": {
-                "status": "completed",
-                "content": cleaned_content,
-                "kept_lines": kept_lines,
-                "processed_at": str(datetime.now())
-            }}
-        )
-        
-        # Cleanup
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(ocr_output_path):
-            os.remove(ocr_output_path)
-        if os.path.exists(cleaned_output_path):
-            os.remove(cleaned_output_path)
-        print(f"Cleanup complete for {filename}")
-        
+        return await search_index.search(q, kind, book_id, limit)
     except Exception as e:
-        print(f"Error processing book {filename}: {e}")
-        db.get_books_db().books.update_one(
-            {"_id": book_id},
-            {"$set": {"status": "failed", "error": str(e)}}
-        )
-        # Cleanup on error too
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(ocr_output_path):
-            os.remove(ocr_output_path)
-        if os.path.exists(cleaned_output_path):
-            os.remove(cleaned_output_path)
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/debug/system")
 async def debug_system():
@@ -239,62 +401,89 @@ async def debug_system():
         "tesseract_langs": tesseract_langs
     }
 
-from datetime import datetime
+@app.get("/api/ocr/scheduler")
+async def ocr_scheduler_stats():
+    try:
+        workers = await db.get_books_db().workers.find({}, {"metrics": 0}).to_list(length=100)
+        return {"jobs": await job_queue.counts(), "workers": workers}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+METRICS_STALE_SECONDS = 120     # worker snapshots older than this are from dead workers
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: this API process plus every live book worker."""
+    try:
+        for status, count in (await job_queue.counts()).items():
+            metrics.set("book_jobs", count, status=status)
+        since = datetime.utcnow() - timedelta(seconds=METRICS_STALE_SECONDS)
+        workers = await db.get_books_db().workers.find(
+            {"seen_at": {"$gte": since}}, {"metrics": 1}
+        ).to_list(length=100)
+        snapshot = merge_metrics([metrics.snapshot()] + [w["metrics"] for w in workers if w.get("metrics")])
+        return Response(content=render_metrics(snapshot), media_type="text/plain; version=0.0.4")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 import uuid
 
 @app.post("/api/books/upload")
 async def upload_book(
-    background_tasks: BackgroundTasks, 
-    file: UploadFile = File(...), 
-    skip_ocr: bool = False
+    request: Request,
+    skip_ocr: bool = False,
+    priority: int = 0
 ):
-    if not file.filename.lower().endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are supported")
-        
-    try:
-        # Generate ID
-        book_id = str(uuid.uuid4())
-        
+    """
+    Multipart upload with the PDF in the `file` field. The body is streamed chunk by
+    chunk into GridFS (skip_ocr) or uploads/ instead of being spooled first.
+    """
+    # Generate ID
+    book_id = str(uuid.uuid4())
+
+    async def open_sink(filename: str, content_type: str):
+        if not filename.lower().endswith('.pdf'):
+            raise UploadError(400, "Only PDF files are supported")
         if skip_ocr:
             # Store in GridFS (Archival Mode)
             fs = AsyncIOMotorGridFSBucket(db.get_books_db())
-            file_id = await fs.upload_from_stream(
-                file.filename,
-                file.file,
-                metadata={"book_id": book_id, "content_type": file.content_type}
-            )
-            
-            book_entry = {
-                "_id": book_id,
-                "filename": file.filename,
-                "status": "archived",
-                "uploaded_at": str(datetime.now()),
-                "gridfs_id": str(file_id)
-            }
+            return GridFSSink(fs, filename, {"book_id": book_id, "content_type": content_type})
+        # Standard Processing Mode: save file locally for processing
+        return DiskSink(os.path.join(UPLOAD_FOLDER, f"{book_id}_{filename}"))
+
+    try:
+        upload = await stream_upload(request, open_sink)
+        sink = upload["sink"]
+
+        book_entry = {
+            "_id": book_id,
+            "filename": upload["filename"],
+            "uploaded_at": str(datetime.now()),
+            "size": upload["size"],
+            "sha256": upload["sha256"],
+        }
+        if skip_ocr:
+            book_entry.update({"status": "archived", "gridfs_id": str(sink.file_id)})
             await db.get_books_db().books.insert_one(book_entry)
             return {"message": "Book archived successfully (OCR skipped)", "book_id": book_id}
 
-        else:
-            # Standard Processing Mode
-            # Save file locally for processing
-            file_path = os.path.join(UPLOAD_FOLDER, f"{book_id}_{file.filename}")
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-                
-            # Create DB entry
-            book_entry = {
-                "_id": book_id,
-                "filename": file.filename,
-                "status": "processing",
-                "uploaded_at": str(datetime.now())
-            }
-            await db.get_books_db().books.insert_one(book_entry)
-            
-            # Trigger background task
-            background_tasks.add_task(process_book_background, file_path, file.filename, book_id)
-            
-            return {"message": "Book uploaded and processing started", "book_id": book_id}
-        
+        # Create DB entry
+        book_entry.update({"status": "processing", "file_path": sink.path})
+        await db.get_books_db().books.insert_one(book_entry)
+
+        # Hand off to the worker processes through the durable queue; the page count
+        # lets short books be leased ahead of long ones
+        try:
+            total_pages = await asyncio.to_thread(pdf_page_count, sink.path)
+        except Exception:
+            total_pages = None     # the worker reports an unreadable PDF
+        await job_queue.enqueue(book_id, sink.path, upload["filename"], priority=priority,
+                                total_pages=total_pages)
+
+        return {"message": "Book uploaded and processing started", "book_id": book_id}
+
+    except UploadError as ue:
+        raise HTTPException(status_code=ue.status_code, detail=ue.detail)
     except Exception as e:
         print(f"Error uploading book: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -302,37 +491,121 @@ async def upload_book(
 @app.get("/api/books")
 async def get_books():
     try:
-        cursor = db.get_books_db().books.find({}, {"content": 0}).sort("uploaded_at", -1)
+        cursor = db.get_books_db().books.find({}, {"content": 0, "line_index": 0}).sort("uploaded_at", -1)
         books = await cursor.to_list(length=100)
         return books
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+BOOK_LINES = 200            # default ?limit for line ranges
+BOOK_MAX_LINES = 5000
+
+def book_etag(book: dict, *query) -> str:
+    # the book document (without its text) changes whenever the text can have
+    # changed; weak, because the bytes differ per Content-Encoding
+    state = json.dumps([jsonable_encoder(book), query], sort_keys=True, ensure_ascii=False)
+    return 'W/"' + hashlib.sha1(state.encode("utf-8")).hexdigest() + '"'
+
 @app.get("/api/books/{book_id}")
-async def get_book_content(book_id: str):
+async def get_book_content(
+    request: Request,
+    book_id: str,
+    page: Optional[int] = Query(None, ge=1, description="one page of the book"),
+    offset: Optional[int] = Query(None, ge=0, description="first line of a line range"),
+    limit: int = Query(BOOK_LINES, ge=1, le=BOOK_MAX_LINES),
+):
+    """
+    The book document with its cleaned text as `content`: the whole book, one
+    `page`, or `limit` lines from line `offset` (`total_lines` tells the viewer how
+    far it can go). Responses carry an ETag, answer If-None-Match with 304 and are
+    compressed with Brotli or gzip when the client accepts it.
+    """
+    books_db = db.get_books_db()
     try:
-        book = await db.get_books_db().books.find_one({"_id": book_id})
+        book = await books_db.books.find_one({"_id": book_id}, {"content": 0})
         if not book:
             raise HTTPException(status_code=404, detail="Book not found")
-        return book
+        etag = book_etag(book, page, offset, limit if offset is not None else None)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+
+        if page is not None:
+            text = await read_book_page(books_db, book_id, page)
+            if text is None:
+                raise HTTPException(status_code=404, detail="Page not found")
+            book["page"] = page
+            book["content"] = text
+        elif offset is not None:
+            lines, total = await read_book_lines(books_db, book, offset, limit)
+            book["offset"] = offset
+            book["limit"] = limit
+            book["total_lines"] = total
+            book["content"] = "\n".join(lines)
+        elif book.get("status") == "completed":
+            full = await books_db.books.find_one({"_id": book_id}, {"content": 1})
+            book["content"] = (full or {}).get("content") or \
+                "".join([chunk async for chunk in iter_book_text(books_db, book)])
+        book.pop("line_index", None)
+        return await json_response(request, book, headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/books/{book_id}/progress")
+async def get_book_progress(book_id: str):
+    """Status and live OCR progress only, cheap enough to poll while a book is processing."""
+    book = await db.get_books_db().books.find_one(
+        {"_id": book_id},
+        {"filename": 1, "status": 1, "progress": 1, "pages": 1, "failed_pages": 1, "error": 1}
+    )
+    if not book:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
+
 @app.get("/api/books/download/all")
-async def download_all_books():
+async def download_all_books(request: Request):
+    """
+    The combined text of all completed books as one gzip file. Only books completed
+    since the last download are added to the cached artifact; the response carries an
+    ETag and honours Range / If-Range so interrupted downloads can resume.
+    """
     try:
-        cursor = db.get_books_db().books.find({"status": "completed"})
-        
-        async def iter_books():
-            async for book in cursor:
-                if "content" in book and book["content"]:
-                    yield f"\n\n--- Book: {book['filename']} ---\n\n"
-                    yield book["content"]
-        
+        # the file comes opened with its manifest, so a rebuild or an append by another
+        # request or API process cannot change what this response sends
+        manifest, f = await refresh_corpus(db.get_books_db())
+        etag, size = manifest["etag"], manifest["size"]
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": f"attachment; filename={ARTIFACT_NAME}",
+        }
+        if request.headers.get("if-none-match") == etag:
+            f.close()
+            return Response(status_code=304, headers=headers)
+
+        byte_range = None
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range == etag:
+            try:
+                byte_range = parse_range(request.headers.get("range"), size)
+            except ValueError:
+                f.close()
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        if byte_range is None:
+            start, end, status = 0, size - 1, 200
+        else:
+            (start, end), status = byte_range, 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+
         return StreamingResponse(
-            iter_books(),
-            media_type="text/plain",
-            headers={"Content-Disposition": "attachment; filename=all_tulu_books.txt"}
+            iter_file_range(f, start, end),
+            status_code=status,
+            media_type="application/gzip",
+            headers=headers
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -358,3 +631,39 @@ async def download_archived_book(book_id: str):
     except Exception as e:
         print(f"Error downloading book: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/books/{book_id}/reocr")
+async def reocr_book(book_id: str, first_page: Optional[int] = None, last_page: Optional[int] = None):
+    """
+    Re-run OCR on pages first_page..last_page of a processed book; every other page is
+    taken from the page checkpoint while the book is unfinished, and from the OCR
+    cache or the text layer where possible once it has completed (the checkpoint is
+    removed then). Without a range, pages the checkpoint lacks or failed are redone.
+    Needs the source PDF (see KEEP_SOURCE_PDF in worker.py).
+    """
+    try:
+        book = await db.get_books_db().books.find_one({"_id": book_id}, {"content": 0})
+        if not book:
+            raise HTTPException(status_code=404, detail="Book not found")
+        if book.get("status") == "processing":
+            raise HTTPException(status_code=409, detail="Book is already being processed")
+        file_path = book.get("file_path")
+        if not file_path or not os.path.exists(file_path):
+            raise HTTPException(status_code=409, detail="Source PDF is no longer available")
+
+        pages = None
+        if first_page is not None:
+            last_page = last_page or first_page
+            if first_page < 1 or last_page < first_page:
+                raise HTTPException(status_code=400, detail="Invalid page range")
+            pages = list(range(first_page, last_page + 1))
+
+        await db.get_books_db().books.update_one({"_id": book_id}, {"$set": {"status": "processing"}})
+        await job_queue.enqueue(book_id, file_path, book["filename"], pages=pages,
+                                total_pages=len(pages) if pages else book.get("pages"))
+        return {"message": "Re-OCR queued", "book_id": book_id, "pages": pages}
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        print(f"Error queueing re-OCR: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,67 @@
+import json
+import os
+from typing import Dict
+
+class PageCheckpoint:
+    """
+    Append-only per-page OCR results for one book (JSON lines, one page per line).
+    Each page is flushed to disk as soon as it is recognized, so a restarted job
+    only redoes the pages that are missing or failed. The last record for a page wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._offsets: Dict[int, int] = {}
+
+    def load(self) -> Dict[int, bool]:
+        """
+        Index the saved pages: page_no -> success. Texts stay on disk until text() asks.
+        """
+        status: Dict[int, bool] = {}
+        self._offsets = {}
+        if not os.path.exists(self.path):
+            return status
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # torn last line from a crash mid-write
+                    offset += len(line)
+                    continue
+                status[record["page"]] = record["ok"]
+                self._offsets[record["page"]] = offset
+                offset += len(line)
+        return status
+
+    def text(self, page_no: int) -> str:
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[page_no])
+            return json.loads(f.readline())["text"]
+
+    def record(self, page_no: int, success: bool, text: str):
+        if self._file is None:
+            torn = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    torn = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            if torn:
+                # terminate a half-written record so the next one starts on its own line
+                self._file.write("\n")
+        self._file.write(json.dumps({"page": page_no, "ok": success, "text": text}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
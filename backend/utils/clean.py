@@ -1,7 +1,13 @@
 import os
 import re
+import io
 import html
-from typing import Tuple
+import mmap
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 # ---------------- CONFIG ----------------
 # Cleaning regexes (from your rules)
@@ -15,41 +21,61 @@ HEADING_RE = re.compile(r"={2,}.*?={2,}")
 URL_RE = re.compile(r"https?:\/\/\S+|www\.\S+")
 ASCII_LETTERS_RE = re.compile(r"[A-Za-z]")
 MULTISPACE_RE = re.compile(r"\s+")
+# Everything ASCII_LETTERS_RE, DIGIT_RE and NON_KANNADA_RE remove, in one class:
+# non-space, non-Kannada characters plus the Kannada digits (U+0CE6-U+0CEF match \d)
+DROP_RE = re.compile(r"[^\s\u0C80-\u0CE5\u0CF0-\u0CFF]+")
+
+CHUNK_BYTES = 16 * 1024 * 1024     # input bytes per parallel cleaning task
 
 def clean_line(line: str) -> str:
-    line = html.unescape(line)
-    line = REF_RE.sub(" ", line)
-    line = TAG_RE.sub(" ", line)
-    line = CITATION_RE.sub(" ", line)
-    line = HEADING_RE.sub(" ", line)
-    line = URL_RE.sub(" ", line)
-    line = URL_RE.sub(" ", line)
-    line = ASCII_LETTERS_RE.sub("", line)
-    line = DIGIT_RE.sub("", line)
-    line = NON_KANNADA_RE.sub("", line)
-    line = MULTISPACE_RE.sub(" ", line).strip()
-    return line
+    """
+    Same output as applying the rules above one after another (see
+    benchmarks/bench_clean.py for the reference cascade), in fewer passes:
+    - structural patterns run only when their trigger text is present, in the
+      original order (a single alternation would not be equivalent: URL_RE's
+      \S+ swallows tags and citations the cascade removes first)
+    - ASCII_LETTERS_RE, DIGIT_RE and NON_KANNADA_RE collapse into one class
+    - MULTISPACE_RE + strip is str.split/join (same Unicode whitespace)
+    """
+    if line.isascii() and "&" not in line:
+        # nothing ASCII survives the character filter (entities may decode to Kannada)
+        return ""
+    if "&" in line:
+        line = html.unescape(line)
+    if "<" in line:
+        line = REF_RE.sub(" ", line)
+        line = TAG_RE.sub(" ", line)
+    if "[" in line:
+        line = CITATION_RE.sub(" ", line)
+    if "==" in line:
+        line = HEADING_RE.sub(" ", line)
+    if "http" in line or "www." in line:
+        # a second URL_RE pass can never match again, so one is enough
+        line = URL_RE.sub(" ", line)
+    line = DROP_RE.sub("", line)
+    return " ".join(line.split())
 
-def clean_text(raw_text: str) -> Tuple[str, int]:
+def clean_lines(lines: Iterable[str]) -> Iterator[str]:
     """
-    Clean a string directly. Returns (cleaned_text, kept_lines_count).
+    Lazily clean an iterable of raw lines, yielding only the lines worth keeping.
     """
-    cleaned_lines = []
-    kept_lines = 0
-    
-    for raw in raw_text.splitlines():
+    for raw in lines:
         s = raw.strip()
         if not s or s.startswith("<doc") or s.startswith("</doc"):
             continue
         cleaned = clean_line(s)
+        # a non-empty cleaned line is Kannada letters and single spaces only,
+        # so the old KANADA_RE.search check always passes
         if not cleaned:
             continue
-        if not KANADA_RE.search(cleaned):
-            continue
-        cleaned_lines.append(cleaned)
-        kept_lines += 1
-        
-    return "\n".join(cleaned_lines), kept_lines
+        yield cleaned
+
+def clean_text(raw_text: str) -> Tuple[str, int]:
+    """
+    Clean a string directly. Returns (cleaned_text, kept_lines_count).
+    """
+    cleaned_lines = list(clean_lines(raw_text.splitlines()))
+    return "\n".join(cleaned_lines), len(cleaned_lines)
 
 def clean_file(input_file: str, output_file: str) -> int:
     """
@@ -58,15 +84,85 @@ def clean_file(input_file: str, output_file: str) -> int:
     # os.makedirs(os.path.dirname(output_file), exist_ok=True)
     kept_lines = 0
     with open(input_file, "r", encoding="utf-8") as infile, open(output_file, "w", encoding="utf-8") as outfile:
-        for raw in infile:
-            s = raw.strip()
-            if not s or s.startswith("<doc") or s.startswith("</doc"):
-                continue
-            cleaned = clean_line(s)
-            if not cleaned:
-                continue
-            if not KANADA_RE.search(cleaned):
-                continue
+        for cleaned in clean_lines(infile):
             outfile.write(cleaned + "\n")
             kept_lines += 1
     return kept_lines
+
+def _byte_ranges(input_file: str, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """
+    Split a file into [start, end) byte ranges of about chunk_bytes, each ending just
+    after a newline (UTF-8 never has 0x0A inside a multi-byte character).
+    """
+    size = os.path.getsize(input_file)
+    if size == 0:
+        return []
+    ranges = []
+    with open(input_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", min(start + chunk_bytes, size) - 1)
+            end = size if end == -1 else end + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def _clean_range(args: Tuple[str, int, int, str]) -> Tuple[str, int]:
+    """
+    args = (input_file, start, end, part_file)
+    Cleans one byte range into part_file. returns: (part_file, kept_lines)
+    """
+    input_file, start, end, part_file = args
+    kept_lines = 0
+    with open(input_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # same universal-newline splitting as iterating a text-mode file
+        lines = io.TextIOWrapper(io.BytesIO(mm[start:end]), encoding="utf-8")
+        with open(part_file, "w", encoding="utf-8") as outfile:
+            for cleaned in clean_lines(lines):
+                outfile.write(cleaned + "\n")
+                kept_lines += 1
+    return part_file, kept_lines
+
+def clean_file_parallel(input_file: str, output_file: str, workers: Optional[int] = None,
+                        chunk_bytes: int = CHUNK_BYTES) -> int:
+    """
+    Clean one (large) file on all cores: newline-aligned byte ranges are cleaned in a
+    process pool and appended to output_file in their original order. Output is
+    identical to clean_file. Returns number of kept lines.
+    """
+    ranges = _byte_ranges(input_file, chunk_bytes)
+    kept_lines = 0
+    out_dir = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.TemporaryDirectory(prefix="clean_parts_", dir=out_dir) as parts_dir, \
+            open(output_file, "wb") as outfile:
+        tasks = [(input_file, start, end, os.path.join(parts_dir, f"{i:06d}.txt"))
+                 for i, (start, end) in enumerate(ranges)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map() yields in submission order, so parts are appended as soon as
+            # every earlier part is done and then deleted
+            for part_file, kept in executor.map(_clean_range, tasks):
+                with open(part_file, "rb") as part:
+                    shutil.copyfileobj(part, outfile)
+                os.remove(part_file)
+                kept_lines += kept
+    return kept_lines
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep only the Kannada text of a file, line by line.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="cleaning processes (default: all cores; 1 = sequential)")
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // (1024 * 1024),
+                        help="input megabytes per task")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        kept_lines = clean_file(args.input_file, args.output_file)
+    else:
+        kept_lines = clean_file_parallel(args.input_file, args.output_file, args.workers,
+                                         args.chunk_mb * 1024 * 1024)
+    print(f"Kept {kept_lines} lines -> {args.output_file}")
+
+if __name__ == "__main__":
+    main()
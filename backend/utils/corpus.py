@@ -0,0 +1,248 @@
+"""
+The combined text of every completed book, kept on disk as one gzip artifact.
+
+The artifact is a series of gzip members, one per book, so new books are added by
+appending a member: the result still decompresses as a single stream. A manifest
+next to it records which books (and which processing run of each) are included;
+it is only rewritten after the appended bytes are on disk, so after a crash the
+artifact is cut back to the size the manifest vouches for. An empty corpus is a
+single empty gzip member, so the artifact is always a valid gzip file.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import zlib
+from typing import BinaryIO, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None    # no cross-process lock (Windows): run a single API process there
+
+# ---------------- CONFIG ----------------
+CORPUS_DIR = os.getenv("CORPUS_DIR", os.path.join("uploads", "corpus"))
+ARTIFACT_NAME = "all_tulu_books.txt.gz"
+GZIP_LEVEL = 6
+READ_CHUNK = 256 * 1024
+# ----------------------------------------
+
+ARTIFACT_PATH = os.path.join(CORPUS_DIR, ARTIFACT_NAME)
+MANIFEST_PATH = os.path.join(CORPUS_DIR, "manifest.json")
+LOCK_PATH = os.path.join(CORPUS_DIR, "build.lock")
+
+# one build at a time per API process; flock on LOCK_PATH across processes
+_build_lock = asyncio.Lock()
+
+async def iter_book_text(books_db, book: dict, dedup: bool = False):
+    """
+    Yield a book's cleaned text in order: the single `content` field of books
+    processed before page storage, otherwise one chunk per stored page.
+    With `dedup`, lines the dedup stage marked as repeats are left out.
+    """
+    if book.get("content"):
+        yield book["content"]
+        return
+    cursor = books_db.book_pages.find({"book_id": book["_id"]}, {"text": 1, "dup_lines": 1}).sort("page", 1)
+    async for page in cursor:
+        text = page.get("text")
+        if text and dedup and page.get("dup_lines"):
+            drop = set(page["dup_lines"])
+            text = "\n".join(line for i, line in enumerate(text.split("\n")) if i not in drop)
+        if text:
+            yield text + "\n"
+
+async def book_line_index(books_db, book: dict) -> List[List[int]]:
+    """
+    [page, first_line, lines] for every stored page of a book, so a range of lines
+    can be read from just the pages holding it. Written by the worker when the book
+    is processed; computed from the pages for books processed before that.
+    """
+    if book.get("line_index") is not None:
+        return book["line_index"]
+    index = []
+    first_line = 0
+    cursor = books_db.book_pages.find({"book_id": book["_id"]}, {"page": 1, "kept_lines": 1}).sort("page", 1)
+    async for page in cursor:
+        lines = page.get("kept_lines", 0)
+        index.append([page["page"], first_line, lines])
+        first_line += lines
+    return index
+
+async def read_book_page(books_db, book_id: str, page_no: int) -> Optional[str]:
+    """One page's cleaned text, or None if the book has no such page."""
+    page = await books_db.book_pages.find_one({"book_id": book_id, "page": page_no}, {"text": 1})
+    return None if page is None else page.get("text", "")
+
+async def read_book_lines(books_db, book: dict, offset: int, limit: int) -> Tuple[List[str], int]:
+    """
+    Lines offset..offset+limit-1 of the book's text (as iter_book_text joins it) and
+    the book's total line count, reading only the pages that hold them.
+    """
+    index = await book_line_index(books_db, book)
+    if not index:
+        # processed before page storage: the text is one field on the book
+        doc = await books_db.books.find_one({"_id": book["_id"]}, {"content": 1})
+        lines = ((doc or {}).get("content") or "").splitlines()
+        return lines[offset:offset + limit], len(lines)
+
+    total = index[-1][1] + index[-1][2]
+    if offset >= total:
+        return [], total
+    starts = [first_line for _, first_line, _ in index]
+    first = bisect.bisect_right(starts, offset) - 1
+    last = bisect.bisect_right(starts, offset + limit - 1) - 1
+    lines: List[str] = []
+    cursor = books_db.book_pages.find(
+        {"book_id": book["_id"], "page": {"$gte": index[first][0], "$lte": index[last][0]}}, {"text": 1}
+    ).sort("page", 1)
+    async for page in cursor:
+        if page.get("text"):
+            lines.extend(page["text"].split("\n"))
+    skip = offset - index[first][1]
+    return lines[skip:skip + limit], total
+
+def _load_manifest() -> dict:
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"books": {}, "order": [], "size": 0}
+
+def _save_manifest(manifest: dict):
+    key = json.dumps([[book_id, manifest["books"][book_id]] for book_id in manifest["order"]])
+    manifest["etag"] = '"' + hashlib.sha1(f"{manifest['size']}:{key}".encode("utf-8")).hexdigest() + '"'
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, MANIFEST_PATH)
+
+def _write_compressed(out, compressor, data: Optional[bytes] = None) -> int:
+    """Compress `data` into `out` (flush the compressor when None); returns bytes written."""
+    return out.write(compressor.compress(data) if data is not None else compressor.flush())
+
+def _sync(out):
+    out.flush()
+    os.fsync(out.fileno())
+
+async def _append_book(books_db, book_id: str, out) -> int:
+    """Write one book as a gzip member; returns the number of bytes written."""
+    book = await books_db.books.find_one({"_id": book_id}, {"filename": 1, "content": 1, "kept_lines": 1})
+    if not book or not (book.get("content") or book.get("kept_lines")):
+        return 0
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    # compression and file writes run off the event loop: a first build covers every book
+    header = f"\n\n--- Book: {book['filename']} ---\n\n".encode("utf-8")
+    written = await asyncio.to_thread(_write_compressed, out, compressor, header)
+    async for chunk in iter_book_text(books_db, book, dedup=True):
+        written += await asyncio.to_thread(_write_compressed, out, compressor, chunk.encode("utf-8"))
+    written += await asyncio.to_thread(_write_compressed, out, compressor)
+    return written
+
+async def refresh_corpus(books_db) -> Tuple[dict, BinaryIO]:
+    """
+    Bring the artifact up to date with the completed books; returns its manifest and
+    the artifact opened for reading (the caller closes it). Books completed since the
+    last build are appended; if an included book was re-processed or is no longer
+    completed, the artifact is rebuilt from scratch.
+    The file is opened before the lock is released: a later append only adds bytes
+    past the manifest's size and a rebuild replaces the file, so what is read from
+    it always matches the manifest returned with it.
+    """
+    async with _build_lock:
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        # closing the lock file releases the flock
+        with open(LOCK_PATH, "a") as lock_file:
+            if fcntl is not None:
+                # other API processes (uvicorn --workers) build into the same files
+                await asyncio.to_thread(fcntl.flock, lock_file.fileno(), fcntl.LOCK_EX)
+            manifest = await _refresh(books_db)
+            return manifest, open(ARTIFACT_PATH, "rb")
+
+async def _refresh(books_db) -> dict:
+    # caller holds the build locks
+    manifest = _load_manifest()
+
+    # only what is needed to tell which books changed; text is read per new book
+    completed = {}
+    async for book in books_db.books.find({"status": "completed"}, {"processed_at": 1}).sort("_id", 1):
+        completed[book["_id"]] = book.get("processed_at")
+
+    stale = any(book_id not in completed or completed[book_id] != processed_at
+                for book_id, processed_at in manifest["books"].items())
+    # size 0: an artifact from before empty ones held an empty gzip member
+    if stale or not os.path.exists(ARTIFACT_PATH) or not manifest["size"]:
+        manifest = {"books": {}, "order": [], "size": 0}
+        path = ARTIFACT_PATH + ".tmp"
+        mode = "wb"
+    else:
+        path = ARTIFACT_PATH
+        mode = "r+b"
+
+    new_books = [book_id for book_id in completed if book_id not in manifest["books"]]
+    if not new_books and mode == "r+b":
+        if os.path.getsize(ARTIFACT_PATH) != manifest["size"]:
+            os.truncate(ARTIFACT_PATH, manifest["size"])
+        if "etag" not in manifest:
+            _save_manifest(manifest)
+        return manifest
+
+    with open(path, mode) as out:
+        # drops anything a crashed append left past the recorded size
+        out.truncate(manifest["size"])
+        out.seek(manifest["size"])
+        for book_id in new_books:
+            manifest["size"] += await _append_book(books_db, book_id, out)
+            manifest["books"][book_id] = completed[book_id]
+            manifest["order"].append(book_id)
+        if not manifest["size"]:
+            # no books with text: zero bytes would not be a gzip file
+            manifest["size"] += _write_compressed(out, zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31))
+        await asyncio.to_thread(_sync, out)
+    if path != ARTIFACT_PATH:
+        os.replace(path, ARTIFACT_PATH)
+    await asyncio.to_thread(_save_manifest, manifest)
+    print(f"Corpus artifact updated: {len(new_books)} books added, "
+          f"{len(manifest['order'])} total, {manifest['size']} bytes")
+    return manifest
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=start-end` Range header into an inclusive (start, end).
+    Returns None when the whole file should be sent; raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start:
+            # suffix range: the last N bytes
+            length = int(end)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            return max(size - length, 0), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        raise ValueError(f"invalid range {header!r}")
+    if first >= size or last < first:
+        raise ValueError(f"range {header!r} outside 0-{size - 1}")
+    return first, min(last, size - 1)
+
+def iter_file_range(f, start: int, end: int):
+    """Read bytes start..end (inclusive) from an already open file, then close it."""
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
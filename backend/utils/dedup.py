@@ -0,0 +1,229 @@
+"""
+Exact and near-duplicate detection for cleaned book text, within a book and against
+every book processed before it (running headers and footers, reprinted editions).
+
+- pages:  MinHash of word shingles; a page whose signature agrees with an earlier
+          page's on at least NEAR_THRESHOLD of its hashes is a duplicate as a whole
+- lines:  exact duplicates by hash; lines of NEAR_MIN_CHARS or more are also
+          compared by MinHash of character shingles
+
+Candidates are found by LSH banding (BANDS bands of ROWS hashes each), so no line
+is ever compared with more than the few that share a band with it. Everything is
+stored in Mongo (dedup_lines, dedup_pages, dedup_bands) and updated as pages are
+processed; inserts on unique _ids decide which occurrence is first, so concurrent
+workers agree. Duplicates are not deleted: pages record their `dup_lines` and the
+corpus download leaves those lines out.
+"""
+import asyncio
+import hashlib
+import os
+import struct
+import unicodedata
+from typing import Dict, List, Set, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+
+# ---------------- CONFIG ----------------
+DEDUP = os.getenv("DEDUP", "1") == "1"
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS            # candidate pairs start around Jaccard (1/BANDS)**(1/ROWS) = 0.5
+NEAR_THRESHOLD = 0.8                # estimated Jaccard similarity that counts as a duplicate
+NEAR_MIN_CHARS = 20                 # shorter lines are only deduplicated exactly
+LINE_SHINGLE = 5                    # characters per line shingle
+PAGE_SHINGLE = 3                    # words per page shingle
+PAGE_MIN_WORDS = 50                 # pages with fewer words are only deduplicated line by line
+# ----------------------------------------
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 64) - 1
+
+def _permutations() -> List[Tuple[int, int]]:
+    # fixed seeds: signatures must stay comparable across processes and restarts
+    perms = []
+    for i in range(NUM_PERM):
+        digest = hashlib.blake2b(f"minhash:{i}".encode("ascii"), digest_size=16).digest()
+        a, b = struct.unpack("<QQ", digest)
+        perms.append((a % (_PRIME - 1) + 1, b % _PRIME))
+    return perms
+
+_PERMS = _permutations()
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+def line_key(line: str) -> str:
+    return hashlib.blake2b(unicodedata.normalize("NFC", line).encode("utf-8"), digest_size=12).hexdigest()
+
+def minhash(shingles: Set[str]) -> List[int]:
+    hashes = [_hash64(s) for s in shingles]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS]
+
+def line_shingles(line: str) -> Set[str]:
+    line = unicodedata.normalize("NFC", line)
+    if len(line) <= LINE_SHINGLE:
+        return {line}
+    return {line[i:i + LINE_SHINGLE] for i in range(len(line) - LINE_SHINGLE + 1)}
+
+def page_shingles(words: List[str]) -> Set[str]:
+    if len(words) <= PAGE_SHINGLE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + PAGE_SHINGLE]) for i in range(len(words) - PAGE_SHINGLE + 1)}
+
+def band_keys(kind: str, signature: List[int]) -> List[str]:
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f"<{ROWS}Q", *(r & _MASK for r in rows)), digest_size=8)
+        keys.append(f"{kind}{band:02d}:{digest.hexdigest()}")
+    return keys
+
+def _line_signatures(lines: List[str], first: Dict[str, int]) -> Dict[str, List[int]]:
+    return {key: minhash(line_shingles(lines[line_no]))
+            for key, line_no in first.items() if len(lines[line_no]) >= NEAR_MIN_CHARS}
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+def _duplicate_indexes(error: BulkWriteError) -> Set[int]:
+    return {e["index"] for e in error.details.get("writeErrors", []) if e.get("code") == 11000}
+
+class DedupIndex:
+    """
+    Pass `database` to run against a stand-in such as mongomock-motor; by default
+    the index lives in textfrombooks.
+
+    Every entry records the book and the processing run that added it. An entry
+    from an earlier run of the same book is that book's own text (a retry or a
+    re-OCR): it is claimed by the new run instead of counting as a duplicate, so a
+    book keeps the lines it was first to contribute.
+    """
+
+    def __init__(self, database=None):
+        self._database = database
+
+    @property
+    def database(self):
+        return self._database if self._database is not None else db.get_books_db()
+
+    async def ensure_indexes(self):
+        for name in ("dedup_lines", "dedup_pages", "dedup_bands"):
+            await self.database[name].create_index([("book_id", ASCENDING)])
+
+    def _is_duplicate(self, entry: dict, book_id: str, run: str) -> bool:
+        return entry["book_id"] != book_id or entry["run"] == run
+
+    async def _near(self, kind: str, collection: str, signatures: Dict[str, List[int]],
+                    book_id: str, run: str) -> Set[str]:
+        """
+        Which of `signatures` (id -> MinHash) are near-duplicates of an indexed entry or
+        of an earlier one in the dict; the others have their bands added to the index.
+        """
+        database = self.database
+        keys = {ref: band_keys(kind, signature) for ref, signature in signatures.items()}
+        wanted = [key for ref_keys in keys.values() for key in ref_keys]
+        bands: Dict[str, str] = {}
+        async for band in database.dedup_bands.find({"_id": {"$in": wanted}}, {"ref": 1}):
+            bands[band["_id"]] = band["ref"]
+
+        candidates = {bands[key] for key in wanted if key in bands} - set(signatures)
+        entries: Dict[str, dict] = {}
+        if candidates:
+            async for entry in database[collection].find({"_id": {"$in": list(candidates)}},
+                                                         {"book_id": 1, "run": 1, "sig": 1}):
+                if entry.get("sig") and self._is_duplicate(entry, book_id, run):
+                    entries[entry["_id"]] = entry
+
+        duplicates = set()
+        new_bands = []
+        for ref, signature in signatures.items():
+            matches = {bands[key] for key in keys[ref] if key in bands}
+            if any(m in entries and similarity(signature, entries[m]["sig"]) >= NEAR_THRESHOLD
+                   for m in matches):
+                duplicates.add(ref)
+                continue
+            # later entries of the same batch are compared with this one too
+            entries[ref] = {"sig": signature}
+            for key in keys[ref]:
+                if key not in bands:
+                    bands[key] = ref
+                    new_bands.append({"_id": key, "ref": ref, "book_id": book_id})
+        if new_bands:
+            try:
+                await database.dedup_bands.insert_many(new_bands, ordered=False)
+            except BulkWriteError as bwe:
+                # another worker took the band first: its entry stays the representative
+                if len(_duplicate_indexes(bwe)) != len(bwe.details.get("writeErrors", [])):
+                    raise
+        return duplicates
+
+    async def _page_duplicate(self, book_id: str, run: str, page_no: int, lines: List[str]) -> bool:
+        words = " ".join(lines).split()
+        if len(words) < PAGE_MIN_WORDS:
+            return False
+        ref = f"{book_id}:{page_no:05d}"
+        # pure Python and a few ms per page: kept off the worker's event loop
+        signature = await asyncio.to_thread(minhash, page_shingles(words))
+        duplicate = bool(await self._near("p", "dedup_pages", {ref: signature}, book_id, run))
+        await self.database.dedup_pages.replace_one(
+            {"_id": ref}, {"book_id": book_id, "run": run, "sig": None if duplicate else signature}, upsert=True
+        )
+        return duplicate
+
+    async def check_page(self, book_id: str, run: str, page_no: int, lines: List[str]) -> List[int]:
+        """
+        Numbers (0-based) of the lines of this cleaned page that repeat text already
+        seen, in this book or any other; every line if the page as a whole does.
+        Lines that are new are added to the index.
+        """
+        if not lines:
+            return []
+        if await self._page_duplicate(book_id, run, page_no, lines):
+            return list(range(len(lines)))
+
+        database = self.database
+        keys = [line_key(line) for line in lines]
+        docs = [{"_id": key, "book_id": book_id, "run": run} for key in dict.fromkeys(keys)]
+        taken: Set[str] = set()
+        try:
+            await database.dedup_lines.insert_many(docs, ordered=False)
+        except BulkWriteError as bwe:
+            if len(_duplicate_indexes(bwe)) != len(bwe.details.get("writeErrors", [])):
+                raise
+            taken = {docs[i]["_id"] for i in _duplicate_indexes(bwe)}
+
+        duplicates: Set[str] = set()
+        if taken:
+            reclaim = []
+            async for entry in database.dedup_lines.find({"_id": {"$in": list(taken)}}, {"book_id": 1, "run": 1}):
+                if self._is_duplicate(entry, book_id, run):
+                    duplicates.add(entry["_id"])
+                else:
+                    reclaim.append(entry["_id"])
+            if reclaim:
+                await database.dedup_lines.update_many({"_id": {"$in": reclaim}}, {"$set": {"run": run}})
+
+        # first occurrence of each line on the page; repeats of it are exact duplicates
+        first: Dict[str, int] = {}
+        dup_lines = []
+        for line_no, key in enumerate(keys):
+            if key in duplicates or key in first:
+                dup_lines.append(line_no)
+            else:
+                first[key] = line_no
+
+        signatures = await asyncio.to_thread(_line_signatures, lines, first)
+        if signatures:
+            near = await self._near("l", "dedup_lines", signatures, book_id, run)
+            stored = [UpdateOne({"_id": key}, {"$set": {"sig": signature}})
+                      for key, signature in signatures.items() if key not in near]
+            if stored:
+                await database.dedup_lines.bulk_write(stored, ordered=False)
+            dup_lines.extend(first[key] for key in near)
+        return sorted(dup_lines)
+
+dedup_index = DedupIndex() if DEDUP else None
@@ -0,0 +1,253 @@
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+import pytesseract
+
+from utils.preprocess import PREPROCESS, preprocess_page
+
+try:
+    # Optional: binds libtesseract in-process so traineddata stays loaded between pages
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# ---------------- CONFIG ----------------
+TESSDATA_PATH = os.getenv("TESSDATA_PREFIX")    # None -> tesseract's compiled-in default
+MAX_TASKS_PER_CHILD = int(os.getenv("OCR_MAX_TASKS_PER_CHILD", "200"))  # pages per worker before recycling (0 = never)
+WORKER_RSS_LIMIT_MB = int(os.getenv("OCR_WORKER_RSS_MB", "1024"))      # recycle when a worker grows past this (0 = no limit)
+# ----------------------------------------
+
+# Per worker process: one initialized engine per language string
+_engines: Dict[str, "tesserocr.PyTessBaseAPI"] = {}
+
+def _get_engine(lang: str):
+    engine = _engines.get(lang)
+    if engine is None:
+        if TESSDATA_PATH:
+            engine = tesserocr.PyTessBaseAPI(path=TESSDATA_PATH, lang=lang)
+        else:
+            engine = tesserocr.PyTessBaseAPI(lang=lang)
+        _engines[lang] = engine
+    return engine
+
+def _init_worker(lang: str):
+    """Load the language models once when the worker process starts."""
+    if tesserocr is not None:
+        _get_engine(lang)
+
+def _mean_confidence(tsv: str) -> Optional[float]:
+    """Mean word confidence from tesseract's TSV output; None for a page without words."""
+    confidences = []
+    for row in tsv.splitlines()[1:]:
+        fields = row.split("\t")
+        if len(fields) == 12 and fields[11].strip():
+            try:
+                conf = float(fields[10])
+            except ValueError:
+                continue
+            if conf >= 0:
+                confidences.append(conf)
+    return sum(confidences) / len(confidences) if confidences else None
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # peak rather than current, but only on platforms without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def recognize_page_measured(args: Tuple[int, str, str]) -> Tuple[Tuple[int, bool, str, Optional[float]], float, float]:
+    """
+    recognize_page plus the worker's RSS after the page (for recycling and per-job
+    peaks) and the seconds it took.
+    """
+    start = time.perf_counter()
+    result = recognize_page(args)
+    return result, _rss_mb(), time.perf_counter() - start
+
+def recognize_page(args: Tuple[int, str, str]) -> Tuple[int, bool, str, Optional[float]]:
+    """
+    args = (page_no, image_path, lang)
+    returns: (page_no, success(bool), text_or_error_msg, mean word confidence 0-100 or None)
+    The rendered image file is removed once recognized.
+    """
+    page_no, image_path, lang = args
+    try:
+        if PREPROCESS:
+            image_path = preprocess_page(image_path)
+        if tesserocr is not None:
+            engine = _get_engine(lang)
+            engine.SetImageFile(image_path)
+            text = engine.GetUTF8Text()
+            confidence = float(engine.MeanTextConf()) if text.strip() else None
+        elif hasattr(pytesseract, "run_and_get_multiple_output"):
+            # one tesseract run for both the text and the word confidences
+            text, tsv = pytesseract.run_and_get_multiple_output(image_path, extensions=["txt", "tsv"], lang=lang)
+            confidence = _mean_confidence(tsv)
+        else:
+            # pytesseract hands a path straight to tesseract, no re-encode to a temp PNG
+            text = pytesseract.image_to_string(image_path, lang=lang)
+            confidence = None
+        return page_no, True, text, confidence
+
+    except Exception as e:
+        return page_no, False, f"[ERROR page {page_no}: {e}]", None
+
+    finally:
+        try:
+            os.remove(image_path)
+        except Exception:
+            pass
+
+class OCREnginePool:
+    """
+    Long-lived pool of OCR worker processes, each holding an initialized engine.
+    Started once (app lifespan) and shared by every book job.
+    Workers are recycled, so leaks in tesseract/leptonica cannot grow without bound:
+    after MAX_TASKS_PER_CHILD pages per worker, or as soon as one worker reports an
+    RSS over WORKER_RSS_LIMIT_MB, new pages are held until the pages on the old
+    executor finish, then go to a fresh one (never two sets of workers at once).
+    A worker killed outright (the kernel's OOM killer) breaks its executor: it is
+    replaced at once and each page lost with it is submitted one more time.
+    (ProcessPoolExecutor's own max_tasks_per_child needs Python 3.11; this works on
+    the 3.10 image and also honours the RSS limit.)
+    """
+    executor: Optional[ProcessPoolExecutor] = None
+    workers: int = 0
+    lang: str = ""
+    recycles: int = 0
+    peak_rss_mb: float = 0.0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: never fork the API process (event loop, Mongo client threads)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.lang,),
+        )
+
+    def start(self, workers: int, lang: str):
+        if self.executor is not None:
+            return
+        self.workers = max(1, workers)
+        self.lang = lang
+        self._lock = threading.Lock()
+        self._tasks = 0
+        self._in_flight = 0         # pages on the current executor
+        self._over_limit = False
+        self._draining: Optional[str] = None    # recycle reason while the old executor finishes
+        self._held: List[Tuple[Future, tuple, bool]] = []
+        self.executor = self._new_executor()
+        engine = "tesserocr" if tesserocr is not None else "pytesseract"
+        print(f"Started OCR engine pool ({self.workers} workers, {engine}, lang={lang})")
+
+    def _replace(self, reason: str) -> List[Tuple[Future, tuple, bool]]:
+        """Swap in a fresh executor; returns the pages held meanwhile. Caller holds self._lock."""
+        # whatever still runs on the old executor completes; then its processes exit
+        self.executor.shutdown(wait=False)
+        self.executor = self._new_executor()
+        self._tasks = 0
+        self._in_flight = 0
+        self._over_limit = False
+        self._draining = None
+        self.recycles += 1
+        held, self._held = self._held, []
+        print(f"Recycled OCR workers ({reason})")
+        return held
+
+    def close(self):
+        if self.executor is not None:
+            with self._lock:
+                held, self._held = self._held, []
+            for result, _, _ in held:
+                result.cancel()
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            print("Closed OCR engine pool")
+
+    @property
+    def running(self) -> bool:
+        return self.executor is not None
+
+    def submit(self, page_no: int, image_path: str, lang: Optional[str] = None) -> Future:
+        """The future resolves to (recognize_page result, worker RSS in MB, seconds)."""
+        result: Future = Future()
+        self._submit(result, (page_no, image_path, lang or self.lang), False)
+        return result
+
+    def _submit(self, result: Future, args: tuple, retried: bool):
+        with self._lock:
+            if self._draining is None:
+                if self._over_limit:
+                    self._draining = f"worker RSS over {WORKER_RSS_LIMIT_MB} MB"
+                elif MAX_TASKS_PER_CHILD and self._tasks >= MAX_TASKS_PER_CHILD * self.workers:
+                    self._draining = f"{self._tasks} pages"
+            if self._draining is not None:
+                if self._in_flight:
+                    self._held.append((result, args, retried))
+                    return
+                held = self._replace(self._draining)
+            else:
+                held = []
+            executor = self.executor
+            self._tasks += 1
+            self._in_flight += 1
+        for entry in held:
+            self._submit(*entry)
+        try:
+            future = executor.submit(recognize_page_measured, args)
+        except BrokenProcessPool as exc:
+            self._broken(executor, result, args, retried, exc)
+            return
+        future.add_done_callback(functools.partial(self._on_done, executor, result, args, retried))
+
+    def _broken(self, executor: ProcessPoolExecutor, result: Future, args: tuple, retried: bool,
+                exc: BaseException):
+        with self._lock:
+            # the first page to see a broken executor replaces it; the rest just resubmit
+            held = self._replace(f"worker process died: {exc}") if executor is self.executor else []
+        for entry in held:
+            self._submit(*entry)
+        if retried:
+            result.set_exception(exc)
+        else:
+            self._submit(result, args, True)
+
+    def _on_done(self, executor: ProcessPoolExecutor, result: Future, args: tuple, retried: bool,
+                 future: Future):
+        if future.cancelled():
+            result.cancel()
+            return
+        exc = future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            self._broken(executor, result, args, retried, exc)
+            return
+        held = []
+        rss_mb = future.result()[1] if exc is None else 0.0
+        with self._lock:
+            self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+            # a retired executor's pages say nothing about the current workers
+            if executor is self.executor:
+                self._in_flight -= 1
+                if WORKER_RSS_LIMIT_MB and rss_mb > WORKER_RSS_LIMIT_MB:
+                    self._over_limit = True
+                if self._draining is not None and not self._in_flight:
+                    held = self._replace(self._draining)
+        for entry in held:
+            self._submit(*entry)
+        if exc is not None:
+            result.set_exception(exc)
+        else:
+            result.set_result(future.result())
+
+engine_pool = OCREnginePool()
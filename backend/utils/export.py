@@ -0,0 +1,237 @@
+"""
+Streaming export of the qa_pairs collection as JSONL, Parquet or Arrow IPC.
+
+    python -m utils.export --format parquet --compression zstd -o qa_pairs.parquet
+    python -m utils.export --format jsonl --compression gzip --since-id <id> -o new.jsonl.gz
+"""
+import argparse
+import asyncio
+import json
+import zlib
+from typing import AsyncIterator, List, Optional
+
+from bson import ObjectId
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# ---------------- CONFIG ----------------
+EXPORT_BATCH = 2000             # documents per cursor batch / row group
+FORMATS = ("jsonl", "parquet", "arrow")
+COMPRESSIONS = ("none", "gzip", "zstd")
+# ----------------------------------------
+
+MEDIA_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+class ExportError(ValueError):
+    pass
+
+def export_document(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "instruction": doc.get("instruction", doc.get("question", "")),  # Fallback for old data
+        "response": doc.get("response", doc.get("answer", "")),         # Fallback for old data
+        "translation_en": doc.get("translation_en"),
+        "source": doc.get("source", "unknown"),
+    }
+
+PROJECTION = {"instruction": 1, "response": 1, "question": 1, "answer": 1,
+              "translation_en": 1, "source": 1}
+
+def export_filename(fmt: str, compression: str) -> str:
+    name = f"qa_pairs.{fmt}"
+    if fmt != "parquet" and compression != "none":
+        name += ".gz" if compression == "gzip" else ".zst"
+    return name
+
+class _Sink:
+    """File-like object that collects what pyarrow writes so it can be streamed out."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._written = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._written += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._written
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class _Compressor:
+    def __init__(self, compression: str):
+        if compression == "gzip":
+            self._c = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ExportError("zstd compression requires the zstandard package")
+            self._c = zstandard.ZstdCompressor().compressobj()
+        else:
+            self._c = None
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data) if self._c else data
+
+    def flush(self) -> bytes:
+        return self._c.flush() if self._c else b""
+
+def _schema():
+    translation = pyarrow.struct([("instruction", pyarrow.string()), ("response", pyarrow.string())])
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("instruction", pyarrow.string()),
+        ("response", pyarrow.string()),
+        ("translation_en", translation),
+        ("source", pyarrow.string()),
+    ])
+
+class _Serializer:
+    """Turns batches of exported rows into bytes; one instance per export."""
+
+    def __init__(self, fmt: str, compression: str):
+        if fmt not in FORMATS:
+            raise ExportError(f"format must be one of {', '.join(FORMATS)}")
+        if compression not in COMPRESSIONS:
+            raise ExportError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+        if fmt in ("parquet", "arrow") and pyarrow is None:
+            raise ExportError(f"{fmt} export requires the pyarrow package")
+        self.fmt = fmt
+        self._writer = None
+        self._sink = _Sink()
+        if fmt == "parquet":
+            # Parquet compresses its own column chunks; the file is never wrapped
+            self._compressor = _Compressor("none")
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self._sink, _schema(), compression="none" if compression == "none" else compression
+            )
+        else:
+            self._compressor = _Compressor(compression)
+            if fmt == "arrow":
+                self._writer = pyarrow.ipc.new_stream(self._sink, _schema())
+
+    def _translation(self, value):
+        if isinstance(value, dict):
+            return {"instruction": value.get("instruction"), "response": value.get("response")}
+        return None
+
+    def _text(self, value) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    def batch(self, rows: List[dict]) -> bytes:
+        if self.fmt == "jsonl":
+            data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        else:
+            table = pyarrow.Table.from_pylist([
+                {
+                    "id": row["id"],
+                    "instruction": self._text(row["instruction"]),
+                    "response": self._text(row["response"]),
+                    "translation_en": self._translation(row["translation_en"]),
+                    "source": self._text(row["source"]),
+                }
+                for row in rows
+            ], schema=_schema())
+            self._writer.write_table(table)
+            data = self._sink.drain()
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        data = b""
+        if self._writer is not None:
+            self._writer.close()
+            data = self._sink.drain()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+def build_query(source: Optional[str] = None, since_id: Optional[str] = None) -> dict:
+    query = {}
+    if source:
+        query["source"] = source
+    if since_id:
+        try:
+            query["_id"] = {"$gt": ObjectId(since_id)}
+        except Exception:
+            raise ExportError("since_id must be a document id")
+    return query
+
+async def export_pairs(collection, fmt: str = "jsonl", compression: str = "none",
+                       source: Optional[str] = None, since_id: Optional[str] = None,
+                       batch_size: int = EXPORT_BATCH) -> AsyncIterator[bytes]:
+    """
+    Stream qa_pairs in _id order (so `since_id` gives incremental exports) through a
+    server-side cursor, serializing and compressing one batch at a time.
+    Validate arguments before the first chunk is sent with check_export_args.
+    """
+    serializer = _Serializer(fmt, compression)
+    cursor = collection.find(build_query(source, since_id), PROJECTION) \
+        .sort("_id", 1).batch_size(batch_size)
+    rows = []
+    async for doc in cursor:
+        rows.append(export_document(doc))
+        if len(rows) >= batch_size:
+            yield serializer.batch(rows)
+            rows = []
+    if rows:
+        yield serializer.batch(rows)
+    yield serializer.finish()
+
+def check_export_args(fmt: str, compression: str, since_id: Optional[str] = None):
+    """Raise ExportError for bad arguments (before a response has started streaming)."""
+    _Serializer(fmt, compression)
+    build_query(None, since_id)
+
+async def _export_to_file(args):
+    from database import db
+
+    db.connect()
+    written = 0
+    try:
+        with open(args.output, "wb") as f:
+            async for chunk in export_pairs(db.get_db().qa_pairs, args.format, args.compression,
+                                            args.source, args.since_id, args.batch):
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        db.close()
+    print(f"Exported {written} bytes -> {args.output}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="none")
+    parser.add_argument("--source", default=None)
+    parser.add_argument("--since-id", default=None, help="only documents with a larger _id")
+    parser.add_argument("--batch", type=int, default=EXPORT_BATCH)
+    asyncio.run(_export_to_file(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
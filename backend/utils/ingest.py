@@ -0,0 +1,247 @@
+import codecs
+import csv
+import hashlib
+import json
+import unicodedata
+from typing import Any, List, Optional
+
+# ---------------- CONFIG ----------------
+MAX_RECORD_BYTES = 16 * 1024 * 1024    # a single JSON item / CSV record larger than this is rejected
+# ----------------------------------------
+
+# Stand-in for a row that could not be parsed; counted as rejected by the caller
+INVALID = object()
+
+class JSONArrayParser:
+    """
+    Incremental parser for a JSON array of objects (or a single top-level object).
+    feed() takes raw bytes as they arrive and returns the items completed so far,
+    so only one item at a time has to be held in memory.
+    Raises ValueError on malformed JSON.
+    """
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._json = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"      # start -> item -> sep -> ... -> end (or single)
+
+    def _skip_ws(self):
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        self._pos = pos
+
+    def _parse(self, final: bool) -> List[Any]:
+        items = []
+        while True:
+            self._skip_ws()
+            if self._pos >= len(self._buf):
+                break
+            ch = self._buf[self._pos]
+            if self._state == "start":
+                if ch == "[":
+                    self._pos += 1
+                    self._state = "first"
+                elif ch == "{":
+                    self._state = "single"
+                else:
+                    raise ValueError("Expected a JSON array or object")
+            elif self._state in ("first", "item"):
+                if ch == "]" and self._state == "first":
+                    self._pos += 1
+                    self._state = "end"
+                    continue
+                try:
+                    item, end = self._json.raw_decode(self._buf, self._pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError("Invalid JSON format")
+                    break
+                if end == len(self._buf) and not final:
+                    # a number or literal may continue in the next chunk
+                    break
+                items.append(item)
+                self._pos = end
+                self._state = "sep"
+            elif self._state == "sep":
+                if ch == ",":
+                    self._pos += 1
+                    self._state = "item"
+                elif ch == "]":
+                    self._pos += 1
+                    self._state = "end"
+                else:
+                    raise ValueError("Invalid JSON format")
+            elif self._state == "single":
+                try:
+                    item, end = self._json.raw_decode(self._buf, self._pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError("Invalid JSON format")
+                    break
+                items.append(item)
+                self._pos = end
+                self._state = "end"
+            else:
+                raise ValueError("Unexpected data after JSON value")
+
+        # drop consumed text so the buffer only ever holds the current item
+        if self._pos:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        if len(self._buf) > MAX_RECORD_BYTES:
+            raise ValueError("JSON item too large")
+        return items
+
+    def feed(self, data: bytes) -> List[Any]:
+        self._buf += self._decoder.decode(data)
+        return self._parse(final=False)
+
+    def close(self) -> List[Any]:
+        self._buf += self._decoder.decode(b"", final=True)
+        items = self._parse(final=True)
+        if self._state != "end":
+            raise ValueError("Invalid JSON format")
+        return items
+
+class _LineParser:
+    """Splits decoded bytes into complete lines; subclasses turn lines into rows."""
+
+    def __init__(self):
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf = ""
+
+    def _complete_lines(self, final: bool) -> List[str]:
+        # split on \n only: JSON strings may legally contain U+2028 and friends
+        if final:
+            complete, self._buf = self._buf, ""
+        else:
+            end = self._buf.rfind("\n") + 1
+            complete, self._buf = self._buf[:end], self._buf[end:]
+        if len(self._buf) > MAX_RECORD_BYTES:
+            raise ValueError("Line too large")
+        lines = complete.split("\n")
+        tail = lines.pop()
+        lines = [line + "\n" for line in lines]
+        if tail:
+            lines.append(tail)
+        return lines
+
+    def _rows(self, lines: List[str]) -> List[Any]:
+        raise NotImplementedError
+
+    def feed(self, data: bytes) -> List[Any]:
+        self._buf += self._decoder.decode(data)
+        return self._rows(self._complete_lines(final=False))
+
+    def close(self) -> List[Any]:
+        self._buf += self._decoder.decode(b"", final=True)
+        return self._rows(self._complete_lines(final=True))
+
+class JSONLinesParser(_LineParser):
+    """One JSON object per line; a line that does not parse becomes INVALID."""
+
+    def _rows(self, lines: List[str]) -> List[Any]:
+        rows = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                rows.append(INVALID)
+        return rows
+
+class CSVParser(_LineParser):
+    """
+    CSV with a header row; rows come back as dicts like csv.DictReader's. Lines are
+    held back while a quoted field is still open, so records may span chunks.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._header: Optional[List[str]] = None
+        self._record: List[str] = []
+        self._quotes = 0
+
+    def _rows(self, lines: List[str]) -> List[Any]:
+        records = []
+        for line in lines:
+            self._record.append(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2 == 0:
+                records.append("".join(self._record))
+                self._record = []
+                self._quotes = 0
+        return self._parse_records(records)
+
+    def _parse_records(self, records: List[str]) -> List[Any]:
+        rows = []
+        for values in csv.reader(records):
+            if self._header is None:
+                self._header = values
+                continue
+            if not values:
+                continue
+            rows.append(dict(zip(self._header, values)))
+        return rows
+
+    def close(self) -> List[Any]:
+        rows = super().close()
+        if self._record:
+            # unterminated quote at EOF: let csv parse what is there
+            leftover, self._record = self._record, []
+            rows.extend(self._parse_records(["".join(leftover)]))
+        return rows
+
+def parser_for(filename: str):
+    """Pick the incremental parser for an upload by extension, or None if unsupported."""
+    name = filename.lower()
+    if name.endswith(".jsonl") or name.endswith(".ndjson"):
+        return JSONLinesParser(), "jsonl_upload"
+    if name.endswith(".json"):
+        return JSONArrayParser(), "json_upload"
+    if name.endswith(".csv"):
+        return CSVParser(), "csv_upload"
+    return None, None
+
+def _normalize_text(value: Any) -> str:
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return " ".join(unicodedata.normalize("NFC", value).split())
+
+def content_hash(instruction: Any, response: Any) -> str:
+    """
+    Identity of a QA pair for deduplication: sha256 over instruction and response
+    after NFC normalization and whitespace collapsing.
+    """
+    key = _normalize_text(instruction) + "\x1f" + _normalize_text(response)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def normalize_pair(row: Any, source: str) -> Optional[dict]:
+    """
+    Map an uploaded row to a qa_pairs document, or None if it is not a valid pair.
+    JSON rows need `instruction` and `response`; CSV rows also accept
+    question/q and answer/a columns.
+    """
+    if not isinstance(row, dict):
+        return None
+    if source == "csv_upload":
+        # Flexible column matching for CSV
+        instruction = row.get('instruction') or row.get('question') or row.get('q')
+        response = row.get('response') or row.get('answer') or row.get('a')
+        if instruction and response:
+            return {"instruction": instruction, "response": response, "source": source,
+                    "content_hash": content_hash(instruction, response)}
+        return None
+    if "instruction" in row and "response" in row:
+        return {
+            "instruction": row["instruction"],
+            "response": row["response"],
+            "translation_en": row.get("translation_en"),
+            "source": source,
+            "content_hash": content_hash(row["instruction"], row["response"])
+        }
+    return None
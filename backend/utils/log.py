@@ -0,0 +1,23 @@
+"""
+Structured logging: one JSON object per line (LOG_FORMAT=json, the default) or
+`message key=value ...` for reading in a terminal (LOG_FORMAT=text).
+
+    log("Finished book", book_id=book_id, pages=120)
+"""
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+# ---------------- CONFIG ----------------
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# ----------------------------------------
+
+def log(message: str, level: str = "info", **fields):
+    if LOG_FORMAT == "json":
+        record = {"ts": datetime.now(timezone.utc).isoformat(), "level": level, "msg": message, "pid": os.getpid()}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+    else:
+        line = " ".join([message] + [f"{key}={value}" for key, value in fields.items()])
+    print(line, file=sys.stdout, flush=True)
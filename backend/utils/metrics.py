@@ -0,0 +1,124 @@
+"""
+Minimal Prometheus-style metrics. Every process (API, book workers) keeps its own
+registry; workers publish snapshots to their `workers` document and GET /metrics
+merges them with the API's, so no multiprocess client library is needed.
+"""
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+# ---------------- CONFIG ----------------
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+           300.0, 900.0, 3600.0)
+# ----------------------------------------
+
+# name -> (type, help); only declared metrics are exported
+METRICS = {
+    "page_stage_seconds": ("histogram", "Time per page in each pipeline stage (render, ocr, clean, db_write)."),
+    "book_stage_seconds": ("histogram", "Time per book in each pipeline stage, and total wall time."),
+    "pages_total": ("counter", "Pages yielded by the OCR pipeline, by where their text came from and result."),
+    "books_total": ("counter", "Book jobs finished, by outcome."),
+    "ocr_worker_busy_seconds_total": ("counter", "Seconds OCR worker processes spent recognizing pages."),
+    "ocr_workers": ("gauge", "OCR worker processes; utilization is ocr_in_flight / ocr_workers."),
+    "ocr_in_flight": ("gauge", "Pages currently being recognized."),
+    "ocr_queue_depth": ("gauge", "Rendered pages waiting for an OCR worker."),
+    "book_jobs": ("gauge", "Book jobs in the durable queue, by status."),
+    "http_request_duration_seconds": ("histogram", "API request latency (to response start), by route."),
+}
+
+def _key(name: str, labels: Dict[str, str]) -> str:
+    if not labels:
+        return name
+    escaped = {k: str(v).replace("\\", "\\\\").replace('"', '\\"') for k, v in labels.items()}
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(escaped.items()))
+    return f"{name}{{{inner}}}"
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, List[float]] = {}    # bucket counts..., sum, count
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0.0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def snapshot(self) -> dict:
+        """Lists of [key, value] pairs: label values may hold characters Mongo keys cannot."""
+        with self._lock:
+            return {
+                "counters": [[k, v] for k, v in self._counters.items()],
+                "gauges": [[k, v] for k, v in self._gauges.items()],
+                "histograms": [[k, list(v)] for k, v in self._histograms.items()],
+            }
+
+def merge(snapshots: Iterable[dict]) -> dict:
+    """Sum counters, histograms and gauges (every gauge is a per-process amount) across processes."""
+    counters: Dict[str, float] = {}
+    gauges: Dict[str, float] = {}
+    histograms: Dict[str, List[float]] = {}
+    for snap in snapshots:
+        for key, value in snap.get("counters", []):
+            counters[key] = counters.get(key, 0.0) + value
+        for key, value in snap.get("gauges", []):
+            gauges[key] = gauges.get(key, 0.0) + value
+        for key, values in snap.get("histograms", []):
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+    return {"counters": list(counters.items()), "gauges": list(gauges.items()),
+            "histograms": list(histograms.items())}
+
+def _split(key: str) -> Tuple[str, str]:
+    name, _, labels = key.partition("{")
+    return name, labels[:-1] if labels else ""
+
+def _with_label(labels: str, extra: str) -> str:
+    return "{" + (f"{labels},{extra}" if labels else extra) + "}"
+
+def render(snapshot: dict) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    families: Dict[str, List[str]] = {name: [] for name in METRICS}
+    for key, value in sorted(snapshot["counters"]) + sorted(snapshot["gauges"]):
+        name, _ = _split(key)
+        if name in families:
+            families[name].append(f"{key} {value}")
+    for key, values in sorted(snapshot["histograms"]):
+        name, labels = _split(key)
+        if name not in families:
+            continue
+        # cumulative buckets, then +Inf which is the total count
+        for bound, count in zip(BUCKETS + ("+Inf",), values[:len(BUCKETS)] + [values[-1]]):
+            le = 'le="%s"' % bound
+            families[name].append(f"{name}_bucket{_with_label(labels, le)} {count}")
+        suffix = "{" + labels + "}" if labels else ""
+        families[name].append(f"{name}_sum{suffix} {values[-2]}")
+        families[name].append(f"{name}_count{suffix} {values[-1]}")
+
+    out = []
+    for name, (kind, help_text) in METRICS.items():
+        if families[name]:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(families[name])
+    return "\n".join(out) + "\n"
+
+metrics = Registry()
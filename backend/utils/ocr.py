@@ -1,139 +1,388 @@
 import os
-import shutil
+import queue
+import tempfile
+import threading
 import time
-import pytesseract
+from contextlib import contextmanager
 from pdf2image import convert_from_path, pdfinfo_from_path
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from tqdm import tqdm
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from utils.checkpoint import PageCheckpoint
+from utils.engine import OCREnginePool
+from utils.log import log
+from utils.metrics import metrics
+from utils.ocr_cache import OCRCache
+from utils.text_layer import extract_text_layer, text_layer_ok
+from utils.scheduler import OCRScheduler, default_worker_count
 
 # ---------------- CONFIG ----------------
 LANG = "kan+eng"            # tesseract languages
 DPI = 150                   # lower DPI reduces memory & CPU, but may lower OCR accuracy
 POPPLER_PATH = None         # e.g. r"C:\path\to\poppler\bin" on Windows or None
-MAX_PAGE_WORKERS = 1
+MAX_PAGE_WORKERS = default_worker_count()   # set OCR_WORKERS to override
+RENDER_CHUNK_PAGES = 8      # pages rasterized per pdftoppm run (amortizes PDF parsing)
+RENDER_QUEUE_SIZE = 16      # rendered pages buffered ahead of the OCR workers
+RENDER_GRAY = True          # rasterize as 8-bit grayscale (.pgm): a third of RGB, same OCR input
+TEXT_LAYER = os.getenv("OCR_TEXT_LAYER", "1") == "1"    # use embedded text that passes the Kannada check
+HIGH_DPI = int(os.getenv("OCR_HIGH_DPI", "300"))         # re-OCR low-confidence pages at this DPI (0 = never)
+LOW_CONFIDENCE = 60         # mean word confidence (0-100) below which a page is re-OCR'd
 # ----------------------------------------
 
-def ocr_page_worker(args: Tuple[str, int, int, str, str]) -> Tuple[int, bool, str]:
+def _page_runs(page_numbers: Iterable[int], chunk_pages: int) -> Iterator[Tuple[int, int]]:
+    """Group sorted page numbers into contiguous (first, last) runs of at most chunk_pages."""
+    first = last = None
+    for page_no in sorted(set(page_numbers)):
+        if first is not None and page_no == last + 1 and page_no - first < chunk_pages:
+            last = page_no
+            continue
+        if first is not None:
+            yield first, last
+        first = last = page_no
+    if first is not None:
+        yield first, last
+
+def render_pages(pdf_path: str, page_numbers: Iterable[int], out_dir: str, dpi: int = DPI,
+                 poppler_path: str = POPPLER_PATH,
+                 chunk_pages: int = RENDER_CHUNK_PAGES,
+                 grayscale: bool = RENDER_GRAY) -> Iterator[Tuple[int, Optional[str], str]]:
     """
-    args = (pdf_path, page_no, dpi, lang, poppler_path)
-    returns: (page_no, success(bool), text_or_error_msg)
+    Rasterize the given pages in contiguous chunks, one pdftoppm run per chunk.
+    yields: (page_no, image_path or None, error_msg)
     """
-    pdf_path, page_no, dpi, lang, poppler_path = args
-    try:
-        # Convert just this page to image
-        if poppler_path:
-            pages = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no, poppler_path=poppler_path)
-        else:
-            pages = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no)
+    kwargs = {"poppler_path": poppler_path} if poppler_path else {}
+    for first, last in _page_runs(page_numbers, chunk_pages):
+        start = time.perf_counter()
+        try:
+            # pdftoppm writes <prefix>-<page>.ppm (.pgm in gray); we only pass paths around, not pixels
+            paths = convert_from_path(pdf_path, dpi=dpi, first_page=first, last_page=last,
+                                      output_folder=out_dir, fmt="ppm", paths_only=True,
+                                      output_file=f"p{first:05d}", grayscale=grayscale, **kwargs)
+        except Exception as e:
+            for page_no in range(first, last + 1):
+                yield page_no, None, f"[ERROR rendering page {page_no}: {e}]"
+            continue
 
-        if not pages:
-            return page_no, False, f"[NO IMAGE for page {page_no}]"
+        # one pdftoppm run per chunk: spread its time evenly over the chunk's pages
+        per_page = (time.perf_counter() - start) / (last - first + 1)
+        for _ in range(first, last + 1):
+            metrics.observe("page_stage_seconds", per_page, stage="render")
 
-        page_image = pages[0]
+        paths = sorted(paths)
+        for offset, page_no in enumerate(range(first, last + 1)):
+            if offset < len(paths):
+                yield page_no, paths[offset], ""
+            else:
+                yield page_no, None, f"[NO IMAGE for page {page_no}]"
 
-        # Run OCR on the page image
-        text = pytesseract.image_to_string(page_image, lang=lang)
+def _render_producer(pdf_path: str, page_numbers: List[int], out_dir: str, dpi: int,
+                     poppler_path: str, page_queue: queue.Queue, stop: threading.Event,
+                     cache: Optional[OCRCache] = None, lang: str = LANG,
+                     stats: Optional[dict] = None):
+    """
+    Render thread: fills the bounded queue, blocking while the OCR workers catch up.
+    Queue items are (page_no, image_path, error, cache_key); the image is hashed here
+    when a cache is given, so the OCR loop never reads pixels. Time spent rendering
+    is added to stats["render_seconds"].
+    """
+    rendered = render_pages(pdf_path, page_numbers, out_dir, dpi, poppler_path)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                page_no, image_path, error = next(rendered)
+            except StopIteration:
+                break
+            if stats is not None:
+                stats["render_seconds"] += time.perf_counter() - start
+            key = cache.page_key(image_path, dpi, lang) if cache is not None and image_path else None
+            item = (page_no, image_path, error, key)
+            while not stop.is_set():
+                try:
+                    page_queue.put(item, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            if stop.is_set():
+                return
+    finally:
+        # the consumer may be gone (it sets `stop`), so never block on a full queue
+        while not stop.is_set():
+            try:
+                page_queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                continue
 
-        # attempt to free memory references quickly
-        try:
-            del page_image
-        except Exception:
-            pass
+@contextmanager
+def _render_thread(pdf_path: str, page_numbers: List[int], out_dir: str, dpi: int,
+                   poppler_path: str, page_queue: queue.Queue, stop: threading.Event,
+                   cache: Optional[OCRCache] = None, lang: str = LANG,
+                   stats: Optional[dict] = None):
+    """
+    Run _render_producer in a thread for the duration of the block. On the way out,
+    however the block ends, the thread is stopped and joined, so it is no longer
+    writing into `out_dir` when that is removed.
+    """
+    producer = threading.Thread(
+        target=_render_producer,
+        args=(pdf_path, page_numbers, out_dir, dpi, poppler_path, page_queue, stop, cache, lang, stats),
+        daemon=True,
+    )
+    producer.start()
+    try:
+        yield producer
+    finally:
+        stop.set()
+        producer.join()
 
-        return page_no, True, text
+def _render_single(pdf_path: str, page_no: int, out_dir: str, dpi: int,
+                   poppler_path: str) -> Optional[str]:
+    """Render one page again (at a higher DPI) for a second OCR pass; None if that fails."""
+    os.makedirs(out_dir, exist_ok=True)
+    for _, image_path, error in render_pages(pdf_path, [page_no], out_dir, dpi, poppler_path):
+        if image_path is None:
+            print(f"  ⚠️ {error}")
+        return image_path
+    return None
 
-    except Exception as e:
-        return page_no, False, f"[ERROR page {page_no}: {e}]"
+def pdf_page_count(pdf_path: str, poppler_path: str = POPPLER_PATH) -> int:
+    info = pdfinfo_from_path(pdf_path, poppler_path=poppler_path) if poppler_path else pdfinfo_from_path(pdf_path)
+    return int(info.get("Pages", 0))
 
-def ocr_book_with_parallel_pages(pdf_path: str, out_txt_path: str, dpi: int = DPI,
-                                 lang: str = LANG, poppler_path: str = POPPLER_PATH,
-                                 max_workers: int = MAX_PAGE_WORKERS) -> bool:
+def iter_book_pages(pdf_path: str, total_pages: int, dpi: int = DPI,
+                    lang: str = LANG, poppler_path: str = POPPLER_PATH,
+                    max_workers: int = MAX_PAGE_WORKERS,
+                    scheduler: Optional[OCRScheduler] = None,
+                    book_id: Optional[str] = None, priority: int = 0,
+                    checkpoint_path: Optional[str] = None,
+                    pages: Optional[Iterable[int]] = None,
+                    cache: Optional[OCRCache] = None,
+                    stats: Optional[dict] = None,
+                    text_layer: bool = TEXT_LAYER,
+                    high_dpi: int = HIGH_DPI) -> Iterator[Tuple[int, bool, str]]:
     """
-    OCR a single PDF book: process pages in parallel (bounded), write a .tmp then rename.
-    Returns True on success, False on failure (partial outputs kept as .tmp if interrupted).
+    OCR a PDF book page by page: pages are recognized in parallel (bounded) and
+    yielded in page order as (page_no, success, text_or_error_msg), so the caller
+    never needs the whole book in memory.
+    Pages are recognized through `scheduler` (the process-wide one shares its workers
+    fairly between concurrent books); without one, a pool is started for this book only.
+    With `checkpoint_path`, every page is persisted as it completes and pages already
+    recognized there are skipped; `pages` forces a re-OCR of those pages, the others
+    coming from the checkpoint or, where it has none, processed as usual.
+    With `text_layer`, pages whose embedded text passes the Kannada-script check are
+    taken as is, without rendering. With `cache`, a PDF seen before reuses its pages'
+    text without rendering, and any rendered page whose image was recognized before
+    skips OCR. A page recognized with a mean confidence under LOW_CONFIDENCE is
+    rendered again at `high_dpi` and re-OCR'd, keeping the more confident result.
+    `stats` is filled with text_layer_pages, high_dpi_pages, render_seconds, ocr_seconds,
+    peak_rss_mb (largest OCR worker RSS seen), and the cache's hits, misses, pdf_match and bytes_saved (page
+    image bytes not recognized).
     """
     book_name = os.path.basename(pdf_path)
-    print(f"\nProcessing book: {book_name}")
 
-    # Get page count
-    try:
-        info = pdfinfo_from_path(pdf_path, poppler_path=poppler_path) if poppler_path else pdfinfo_from_path(pdf_path)
-        total_pages = int(info.get("Pages", 0))
-    except Exception as e:
-        print(f"  ❌ Could not read PDF info: {e}")
-        return False
-
-    if total_pages == 0:
-        print("  ⚠️ No pages found. Skipping.")
-        return False
-
-    temp_out = out_txt_path + ".tmp"
-    # remove stale temp
-    if os.path.exists(temp_out):
-        try:
-            os.remove(temp_out)
-        except Exception:
-            pass
+    checkpoint = PageCheckpoint(checkpoint_path) if checkpoint_path else None
+    saved = checkpoint.load() if checkpoint else {}
+
+    forced = {p for p in pages if 1 <= p <= total_pages} if pages is not None else set()
+    if pages is not None:
+        # pages the checkpoint does not have (it is removed once a book completes) are
+        # processed as usual alongside the forced ones
+        todo = [p for p in range(1, total_pages + 1) if p in forced or p not in saved]
+    else:
+        todo = [p for p in range(1, total_pages + 1) if not saved.get(p, False)]
+    if checkpoint and len(todo) < total_pages:
+        log("Resuming from checkpoint", book_id=book_id, checkpoint_pages=total_pages - len(todo),
+            ocr_pages=len(todo))
+
+    stats = stats if stats is not None else {}
+    stats.update({"text_layer_pages": 0, "high_dpi_pages": 0, "render_seconds": 0.0, "ocr_seconds": 0.0,
+                  "hits": 0, "misses": 0, "pdf_match": False, "bytes_saved": 0})
+
+    # born-digital pages: embedded Unicode text needs no OCR (never for a forced re-OCR)
+    layer_pages: Dict[int, str] = {}
+    if text_layer and len(todo) > len(forced):
+        embedded = extract_text_layer(pdf_path, poppler_path)
+        for page_no in todo:
+            if page_no not in forced and page_no <= len(embedded) and text_layer_ok(embedded[page_no - 1]):
+                layer_pages[page_no] = embedded[page_no - 1]
+        del embedded
+        if layer_pages:
+            todo = [p for p in todo if p not in layer_pages]
+            stats["text_layer_pages"] = len(layer_pages)
+            log("Using PDF text layer", book_id=book_id, text_layer_pages=len(layer_pages), ocr_pages=len(todo))
 
-    # We'll store results in a dict indexed by page_no
-    page_results = {}
+    book_key = None
+    page_keys: Dict[int, str] = {}      # page -> cache key of its rendered image
+    # pages answered from the cache without rendering, with their text: read now, as the
+    # LRU may evict an entry before its page's turn comes, and a lookup that misses
+    # leaves the page to be rendered and OCR'd like any other
+    cached_pages: Dict[int, str] = {}
+    if cache is not None:
+        book_key = cache.book_key(pdf_path, dpi, lang)
+        # a forced re-OCR must not be answered from the cache
+        if len(todo) > len(forced):
+            page_keys = cache.get_book(book_key)
+            stats["pdf_match"] = bool(page_keys)
+            for page_no in todo:
+                found = page_no in page_keys and page_no not in forced
+                entry = cache.get_page(page_keys[page_no]) if found else None
+                if entry is not None:
+                    cached_pages[page_no] = entry["text"]
+                    stats["hits"] += 1
+                    stats["bytes_saved"] += entry.get("image_bytes", 0)
+            if cached_pages:
+                todo = [p for p in todo if p not in cached_pages]
+                log("Using OCR cache", book_id=book_id, cached_pages=len(cached_pages), ocr_pages=len(todo))
+    todo_set = set(todo)
 
-    # limit workers to total_pages
-    workers = max(1, min(max_workers, total_pages))
+    own_scheduler = scheduler is None or not scheduler.running
+    if own_scheduler:
+        # limit workers to the pages left to OCR
+        scheduler = OCRScheduler(OCREnginePool())
+        scheduler.start(lang, max(1, min(max_workers, len(todo) or 1)))
+    workers = scheduler.workers
+    job = scheduler.open_job(book_id or book_name, len(todo), priority)
 
-    start_time = time.time()
+    # pages OCR'd this run that are waiting for an earlier page before being yielded
+    finished = {}
+    next_page = 1
+
+    def ready_pages():
+        nonlocal next_page
+        while next_page <= total_pages:
+            if next_page in finished:
+                success, text_or_err, source = finished.pop(next_page)
+            elif next_page in todo_set:
+                return
+            elif next_page in layer_pages:
+                success, text_or_err, source = True, layer_pages.pop(next_page), "text_layer"
+                if checkpoint:
+                    checkpoint.record(next_page, success, text_or_err)
+            elif next_page in cached_pages:
+                success, text_or_err, source = True, cached_pages.pop(next_page), "cache"
+                if checkpoint:
+                    checkpoint.record(next_page, success, text_or_err)
+            elif next_page in saved:
+                success, text_or_err, source = saved[next_page], checkpoint.text(next_page), "checkpoint"
+            else:
+                success, text_or_err, source = False, "[NO RESULT]", "none"
+            metrics.inc("pages_total", source=source, result="ok" if success else "failed")
+            yield next_page, success, text_or_err
+            next_page += 1
+
+    def store(page_no: int, success: bool, text_or_err: str, source: str = "ocr"):
+        finished[page_no] = (success, text_or_err, source)
+        if checkpoint:
+            checkpoint.record(page_no, success, text_or_err)
+
+    stop = threading.Event()
     try:
-        # Submit all page jobs but executor will only run worker-count at a time
-        with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from ready_pages()
+
+        # Render thread stays ahead of the workers by at most RENDER_QUEUE_SIZE pages;
+        # it is joined before render_dir is removed
+        page_queue: queue.Queue = queue.Queue(maxsize=RENDER_QUEUE_SIZE)
+        with tempfile.TemporaryDirectory(prefix="ocr_render_") as render_dir, \
+                _render_thread(pdf_path, todo, render_dir, dpi, poppler_path, page_queue, stop,
+                               cache, lang, stats):
+
             future_to_page = {}
-            for page_no in range(1, total_pages + 1):
-                args = (pdf_path, page_no, dpi, lang, poppler_path)
-                future = executor.submit(ocr_page_worker, args)
-                future_to_page[future] = page_no
-
-            # Progress bar for pages
-            with tqdm(total=total_pages, desc=book_name, unit="pg", ncols=80) as pbar:
-                for future in as_completed(future_to_page):
-                    page_no = future_to_page[future]
-                    try:
-                        pno, success, text_or_err = future.result()
-                    except Exception as exc:
-                        pno = page_no
-                        success = False
-                        text_or_err = f"[EXCEPTION worker for page {page_no}: {exc}]"
-
-                    # store result (so we can write pages in order later)
-                    page_results[pno] = (success, text_or_err)
-                    pbar.update(1)
-
-        # All page jobs completed (maybe with failures). Write the output file in order.
-        with open(temp_out, "w", encoding="utf-8") as fout:
-            for page_no in range(1, total_pages + 1):
-                res = page_results.get(page_no)
-                if res is None:
-                    fout.write(f"--- Page {page_no} ---\n[NO RESULT]\n\n")
-                else:
-                    success, text_or_err = res
-                    fout.write(f"--- Page {page_no} ---\n")
-                    fout.write(text_or_err if success else text_or_err + "\n")
-                    fout.write("\n\n")
-
-        # move temp to final
-        shutil.move(temp_out, out_txt_path)
-        elapsed = time.time() - start_time
-        print(f"  ✅ Saved: {out_txt_path}  (pages: {total_pages}, elapsed: {elapsed:.1f}s)")
-        return True
-
-    except KeyboardInterrupt:
-        print("\n  ⏸ Interrupted by user. Partial results may remain as .tmp")
-        # leave temp as-is so user can inspect
-        return False
-    except Exception as e:
-        print(f"  ❌ Unexpected error while processing book: {e}")
-        try:
-            if os.path.exists(temp_out):
-                os.remove(temp_out)
-        except Exception:
-            pass
-        return False
+            image_bytes = {}
+            low_confidence = {}     # page -> (text, confidence) of the first pass, while re-OCR'd
+            high_dpi_dir = os.path.join(render_dir, "high_dpi")
+            high_dpi_renders = set()    # futures of pages being rendered again at high_dpi
+            rendering_done = False
+            # pages in flight plus pages held back for ordering
+            window = workers * 4
+
+            # Progress bar for pages (only drawn on a terminal); high-DPI re-renders run in
+            # `renderer`, so recognized pages keep flowing while one is rendered
+            with ThreadPoolExecutor(max_workers=1) as renderer, \
+                    tqdm(total=len(todo), desc=book_name, unit="pg", ncols=80, disable=None) as pbar:
+                while not rendering_done or future_to_page:
+                    while not rendering_done and len(future_to_page) + len(finished) < window:
+                        item = page_queue.get()
+                        if item is None:
+                            rendering_done = True
+                            break
+                        page_no, image_path, error, key = item
+                        if image_path is None:
+                            store(page_no, False, error)
+                            pbar.update(1)
+                            continue
+                        size = os.path.getsize(image_path)
+                        if key is not None:
+                            page_keys[page_no] = key
+                            entry = cache.get_page(key) if page_no not in forced else None
+                            if entry is not None:
+                                os.remove(image_path)
+                                store(page_no, True, entry["text"], "cache")
+                                stats["hits"] += 1
+                                stats["bytes_saved"] += size
+                                pbar.update(1)
+                                continue
+                            stats["misses"] += 1
+                        image_bytes[page_no] = size
+                        future = scheduler.submit(job, page_no, image_path, lang)
+                        future_to_page[future] = page_no
+
+                    if future_to_page:
+                        done, _ = wait(future_to_page, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            page_no = future_to_page.pop(future)
+                            if future in high_dpi_renders:
+                                high_dpi_renders.discard(future)
+                                image_path = future.result()
+                                if image_path is not None:
+                                    stats["high_dpi_pages"] += 1
+                                    future = scheduler.submit(job, page_no, image_path, lang, second_pass=True)
+                                    future_to_page[future] = page_no
+                                    continue
+                                # could not render it again: the first pass stands (below)
+                                pno, success, text_or_err, confidence = page_no, False, "", None
+                            else:
+                                try:
+                                    pno, success, text_or_err, confidence = future.result()
+                                except Exception as exc:
+                                    pno = page_no
+                                    success = False
+                                    text_or_err = f"[EXCEPTION worker for page {page_no}: {exc}]"
+                                    confidence = None
+
+                            if pno in low_confidence:
+                                # second pass: keep whichever pass was more confident
+                                first_text, first_confidence = low_confidence.pop(pno)
+                                if not success or (confidence or 0) < first_confidence:
+                                    success, text_or_err = True, first_text
+                            elif (success and confidence is not None and confidence < LOW_CONFIDENCE
+                                  and high_dpi > dpi):
+                                low_confidence[pno] = (text_or_err, confidence)
+                                render = renderer.submit(_render_single, pdf_path, pno, high_dpi_dir,
+                                                         high_dpi, poppler_path)
+                                high_dpi_renders.add(render)
+                                future_to_page[render] = pno
+                                continue
+
+                            if success and pno in page_keys:
+                                cache.put_page(page_keys[pno], text_or_err, image_bytes.get(pno, 0))
+                            image_bytes.pop(pno, None)
+                            store(pno, success, text_or_err)
+                            pbar.update(1)
+
+                    yield from ready_pages()
+
+        if cache is not None and page_keys:
+            cache.put_book(book_key, page_keys)
+
+        yield from ready_pages()
+
+    finally:
+        stop.set()
+        if checkpoint:
+            checkpoint.close()
+        stats["peak_rss_mb"] = round(job.peak_rss_mb, 1)
+        stats["ocr_seconds"] = job.ocr_seconds
+        scheduler.close_job(job)
+        if own_scheduler:
+            scheduler.close()
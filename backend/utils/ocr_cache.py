@@ -0,0 +1,158 @@
+"""
+Content-addressed cache of recognized page text, so re-uploaded books and editions
+that share pages are not OCR'd again.
+
+Pages are keyed by the sha256 of the rendered page image plus dpi/lang, whole PDFs by
+the sha256 of the file plus dpi/lang (mapping page numbers to page keys). Entries are
+small JSON files under OCR_CACHE_DIR, evicted least recently used once the directory
+grows past OCR_CACHE_MB. With OCR_CACHE_MONGO=1 every entry is also mirrored to the
+`ocr_cache` collection, so a fresh container can start warm.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+# ---------------- CONFIG ----------------
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join("uploads", "ocr_cache"))
+OCR_CACHE_MB = int(os.getenv("OCR_CACHE_MB", "1024"))          # 0 disables the cache
+OCR_CACHE_MONGO = os.getenv("OCR_CACHE_MONGO", "0") == "1"
+EVICT_TO = 0.9                                                  # evict down to this share of the cap
+HASH_CHUNK = 1024 * 1024
+# ----------------------------------------
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class OCRCache:
+    """
+    Disk store shared by every process using the same directory. Writes are atomic
+    (temp file + rename); a hit refreshes the file's mtime, which is the LRU order.
+    Mirror failures are logged and never fail the OCR itself.
+    """
+
+    def __init__(self, root: str, max_bytes: int, mirror: bool = False):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mirror = mirror
+        self._collection = None
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None   # bytes on disk, counted on first write
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.root, kind, key[:2], key + ".json")
+
+    def _mirror_collection(self):
+        if self._collection is None:
+            from pymongo import MongoClient
+            from database import MONGODB_URL
+            self._collection = MongoClient(MONGODB_URL)["textfrombooks"].ocr_cache
+        return self._collection
+
+    def book_key(self, pdf_path: str, dpi: int, lang: str) -> str:
+        return hashlib.sha256(f"{file_digest(pdf_path)}:{dpi}:{lang}".encode("utf-8")).hexdigest()
+
+    def page_key(self, image_path: str, dpi: int, lang: str) -> str:
+        return hashlib.sha256(f"{file_digest(image_path)}:{dpi}:{lang}".encode("utf-8")).hexdigest()
+
+    def _read(self, kind: str, key: str) -> Optional[dict]:
+        path = self._path(kind, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+            return value
+        except (FileNotFoundError, ValueError):
+            pass
+        if not self.mirror:
+            return None
+        try:
+            doc = self._mirror_collection().find_one({"_id": f"{kind}:{key}"})
+        except Exception as e:
+            print(f"  ⚠️ OCR cache mirror read failed: {e}")
+            return None
+        if doc is None:
+            return None
+        self._write(kind, key, doc["value"], mirror=False)
+        return doc["value"]
+
+    def _write(self, kind: str, key: str, value: dict, mirror: bool = True):
+        path = self._path(kind, key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        try:
+            replaced = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - replaced
+            if self._size > self.max_bytes:
+                self._evict()
+
+        if mirror and self.mirror:
+            try:
+                self._mirror_collection().replace_one(
+                    {"_id": f"{kind}:{key}"}, {"value": value}, upsert=True
+                )
+            except Exception as e:
+                print(f"  ⚠️ OCR cache mirror write failed: {e}")
+
+    def _entries(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".json"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:
+                        continue
+
+    def _scan_size(self) -> int:
+        return sum(st.st_size for _, st in self._entries())
+
+    def _evict(self):
+        # rescan: other worker processes write to the same directory
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        size = sum(st.st_size for _, st in entries)
+        target = int(self.max_bytes * EVICT_TO)
+        for path, st in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= st.st_size
+        self._size = size
+
+    def get_page(self, key: str) -> Optional[dict]:
+        """{"text", "image_bytes"} for a page image recognized before, or None."""
+        return self._read("pages", key)
+
+    def put_page(self, key: str, text: str, image_bytes: int):
+        self._write("pages", key, {"text": text, "image_bytes": image_bytes})
+
+    def get_book(self, key: str) -> Dict[int, str]:
+        """Page number -> page key for a PDF seen before ({} if unknown)."""
+        value = self._read("books", key)
+        return {int(page): page_key for page, page_key in value["pages"].items()} if value else {}
+
+    def put_book(self, key: str, page_keys: Dict[int, str]):
+        pages = self.get_book(key)
+        pages.update(page_keys)
+        self._write("books", key, {"pages": {str(page): page_key for page, page_key in sorted(pages.items())}})
+
+ocr_cache = OCRCache(OCR_CACHE_DIR, OCR_CACHE_MB * 1024 * 1024, OCR_CACHE_MONGO) if OCR_CACHE_MB > 0 else None
@@ -0,0 +1,59 @@
+"""
+JSON responses compressed for the client (Brotli when the optional `brotli` package
+is installed, else gzip) and conditional-request helpers for ETag revalidation.
+"""
+import asyncio
+import gzip
+import json
+from typing import Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ---------------- CONFIG ----------------
+COMPRESS_MIN_BYTES = 1024      # smaller bodies are sent as is
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5             # 11 compresses a little better at many times the CPU
+# ----------------------------------------
+
+def _accepted(request: Request) -> set:
+    codings = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            codings.add(coding.strip().lower())
+    return codings
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for it)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    return any((tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == bare
+               for tag in header.split(","))
+
+def not_modified(etag: str, headers: Optional[dict] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+
+async def json_response(request: Request, payload, headers: Optional[dict] = None) -> Response:
+    """Serialize `payload` and compress it with the best coding the client accepts."""
+    body = json.dumps(jsonable_encoder(payload), ensure_ascii=False).encode("utf-8")
+    headers = {**(headers or {}), "Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = _accepted(request)
+        # off the event loop: a whole book is several megabytes
+        if brotli is not None and "br" in accepted:
+            body = await asyncio.to_thread(brotli.compress, body, quality=BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            body = await asyncio.to_thread(gzip.compress, body, GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
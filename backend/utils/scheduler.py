@@ -0,0 +1,211 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List, Optional, Tuple
+
+from utils.engine import OCREnginePool, engine_pool
+from utils.metrics import metrics
+
+# ---------------- CONFIG ----------------
+OCR_WORKERS = os.getenv("OCR_WORKERS")                  # overrides the CPU/memory based size
+# book worker processes on this machine (main.py starts BOOK_WORKERS); each sizes its pool to its share
+BOOK_WORKERS = max(1, int(os.getenv("BOOK_WORKERS", "1")))
+WORKER_MEMORY_MB = int(os.getenv("OCR_WORKER_MEMORY_MB", "600"))   # budget per tesseract worker
+SCHEDULER_POLICY = os.getenv("OCR_SCHEDULER_POLICY", "round_robin")  # round_robin | sjf
+# ----------------------------------------
+
+def _available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _available_memory_mb() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+def default_worker_count() -> int:
+    """
+    OCR_WORKERS if set, else one worker per usable core, capped by available memory;
+    both are split evenly between the BOOK_WORKERS processes, which would otherwise
+    each start a worker per core.
+    """
+    if OCR_WORKERS:
+        return max(1, int(OCR_WORKERS))
+    workers = _available_cpus() // BOOK_WORKERS
+    memory_mb = _available_memory_mb()
+    if memory_mb is not None:
+        workers = min(workers, memory_mb // BOOK_WORKERS // WORKER_MEMORY_MB)
+    return max(1, workers)
+
+class BookJob:
+    """Pages of one book waiting for (or running on) the shared pool."""
+
+    def __init__(self, book_id: str, total_pages: int, priority: int, seq: int):
+        self.book_id = book_id
+        self.total_pages = total_pages
+        self.priority = priority
+        self.seq = seq
+        self.pending: Deque[Tuple[int, str, str, Future]] = deque()
+        self.running = 0
+        self.done = 0
+        self.peak_rss_mb = 0.0      # largest OCR worker RSS seen after one of this book's pages
+        self.ocr_seconds = 0.0      # worker time spent recognizing this book's pages
+        self.started_at = time.time()
+
+    @property
+    def remaining(self) -> int:
+        return self.total_pages - self.done
+
+    def stats(self) -> dict:
+        return {
+            "book_id": self.book_id,
+            "priority": self.priority,
+            "total_pages": self.total_pages,
+            "done": self.done,
+            "running": self.running,
+            "queued": len(self.pending),
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+        }
+
+class OCRScheduler:
+    """
+    Process-wide OCR scheduler. Owns the engine pool and decides which book's page
+    runs next, so concurrent books share workers fairly instead of each starting
+    its own pool.
+    - round_robin: books take turns, one page each
+    - sjf: the book with the fewest remaining pages goes first
+    Higher `priority` always wins over lower.
+    """
+
+    def __init__(self, pool: OCREnginePool, policy: str = SCHEDULER_POLICY):
+        self.pool = pool
+        self.policy = policy
+        self.jobs: Dict[str, BookJob] = {}
+        self.in_flight = 0
+        self._lock = threading.RLock()   # re-entered when a pool future is already done
+        self._seq = itertools.count()
+        self._rr_turn = itertools.count()
+        self._last_served: Dict[str, int] = {}
+
+    def start(self, lang: str, workers: Optional[int] = None):
+        self.pool.start(workers or default_worker_count(), lang)
+
+    def close(self):
+        self.pool.close()
+
+    @property
+    def running(self) -> bool:
+        return self.pool.running
+
+    @property
+    def workers(self) -> int:
+        return self.pool.workers
+
+    def open_job(self, book_id: str, total_pages: int, priority: int = 0) -> BookJob:
+        with self._lock:
+            job = BookJob(book_id, total_pages, priority, next(self._seq))
+            self.jobs[book_id] = job
+            return job
+
+    def close_job(self, job: BookJob):
+        with self._lock:
+            for _, _, _, future in job.pending:
+                future.cancel()
+            job.pending.clear()
+            self.jobs.pop(job.book_id, None)
+            self._last_served.pop(job.book_id, None)
+
+    def submit(self, job: BookJob, page_no: int, image_path: str, lang: str,
+               second_pass: bool = False) -> Future:
+        """
+        Queue a rendered page; the returned future resolves to recognize_page's
+        (page_no, success, text_or_error, confidence). A `second_pass` page was done
+        already: it is counted again only once this result is in.
+        """
+        future: Future = Future()
+        with self._lock:
+            if second_pass:
+                job.done -= 1
+            job.pending.append((page_no, image_path, lang, future))
+            self._dispatch()
+        return future
+
+    def _pick(self) -> Optional[BookJob]:
+        ready = [job for job in self.jobs.values() if job.pending]
+        if not ready:
+            return None
+        top = max(job.priority for job in ready)
+        ready = [job for job in ready if job.priority == top]
+        if self.policy == "sjf":
+            return min(ready, key=lambda job: (job.remaining, job.seq))
+        # least recently served first
+        return min(ready, key=lambda job: (self._last_served.get(job.book_id, -1), job.seq))
+
+    def _dispatch(self):
+        # caller holds self._lock
+        while self.in_flight < self.pool.workers:
+            job = self._pick()
+            if job is None:
+                return
+            page_no, image_path, lang, future = job.pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            job.running += 1
+            self.in_flight += 1
+            self._last_served[job.book_id] = next(self._rr_turn)
+            try:
+                pool_future = self.pool.submit(page_no, image_path, lang)
+            except Exception as exc:
+                job.running -= 1
+                self.in_flight -= 1
+                future.set_exception(exc)
+                continue
+            pool_future.add_done_callback(
+                lambda f, job=job, future=future: self._on_done(job, future, f)
+            )
+
+    def _on_done(self, job: BookJob, future: Future, pool_future: Future):
+        try:
+            result, rss_mb, seconds = pool_future.result()
+        except Exception as exc:
+            result, rss_mb, seconds, error = None, 0.0, 0.0, exc
+        else:
+            error = None
+            metrics.observe("page_stage_seconds", seconds, stage="ocr")
+            metrics.inc("ocr_worker_busy_seconds_total", seconds)
+        with self._lock:
+            job.running -= 1
+            job.done += 1
+            job.peak_rss_mb = max(job.peak_rss_mb, rss_mb)
+            job.ocr_seconds += seconds
+            self.in_flight -= 1
+            self._dispatch()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs: List[dict] = [job.stats() for job in sorted(self.jobs.values(), key=lambda j: j.seq)]
+            return {
+                "workers": self.pool.workers,
+                "policy": self.policy,
+                "in_flight": self.in_flight,
+                "recycles": self.pool.recycles,
+                "peak_worker_rss_mb": round(self.pool.peak_rss_mb, 1),
+                "queue_depth": sum(len(job.pending) for job in self.jobs.values()),
+                "jobs": jobs,
+            }
+
+scheduler = OCRScheduler(engine_pool)
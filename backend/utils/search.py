@@ -0,0 +1,343 @@
+"""
+Inverted index over book pages and QA pairs, stored in the textfrombooks database
+and updated as books complete and pairs are inserted.
+
+- search_postings: one document per (term, page or pair) with the term frequency,
+  the document length and the line numbers the term is on
+- search_terms:    term -> document frequency; its _id index also serves prefix
+  lookups, so a query word matches every indexed word it is a prefix of
+- search_meta:     document and token totals for BM25
+
+Run `python -m utils.search --rebuild` to index everything already in Mongo.
+"""
+import argparse
+import asyncio
+import math
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from database import db
+
+# ---------------- CONFIG ----------------
+MIN_PREFIX_CHARS = 2        # shorter query words only match exactly
+PREFIX_EXPANSION = 16       # indexed words tried per query word
+MAX_QUERY_TERMS = 8
+MAX_CANDIDATES = 20000      # postings read for the rarest query word
+MAX_LINES = 16              # line numbers kept per posting
+SNIPPET_LINES = 3
+WRITE_BATCH = 1000
+PAGE_BATCH = 64             # pages tokenized per write when indexing a book
+BM25_K1 = 1.2
+BM25_B = 0.75
+# ----------------------------------------
+
+# A word is a run of letters/digits plus Kannada vowel signs, viramas and the zero
+# width (non-)joiners: \w alone would cut every word at its first combining sign.
+TOKEN_RE = re.compile(r"[\w\u0C80-\u0CFF\u200C\u200D]+")
+QA_FIELDS = ("instruction", "response", "translation_en.instruction", "translation_en.response")
+
+def tokenize(text: str) -> List[str]:
+    """NFC-normalized, case-folded words of a line (the output of clean_line, or raw QA text)."""
+    words = TOKEN_RE.findall(unicodedata.normalize("NFC", text).casefold())
+    return [w for w in (word.strip("\u200C\u200D_") for word in words) if w]
+
+def _line_terms(lines: Iterable[str]) -> Tuple[Dict[str, Tuple[int, List[int]]], int]:
+    """term -> (frequency, line numbers) and the number of tokens."""
+    terms: Dict[str, Tuple[int, List[int]]] = {}
+    length = 0
+    for line_no, line in enumerate(lines):
+        for term in tokenize(line):
+            length += 1
+            tf, on_lines = terms.get(term, (0, []))
+            if not on_lines or on_lines[-1] != line_no:
+                if len(on_lines) < MAX_LINES:
+                    on_lines.append(line_no)
+            terms[term] = (tf + 1, on_lines)
+    return terms, length
+
+def _qa_lines(pair: dict) -> List[str]:
+    translation = pair.get("translation_en")
+    if not isinstance(translation, dict):
+        translation = {}
+    values = [pair.get("instruction"), pair.get("response"),
+              translation.get("instruction"), translation.get("response")]
+    # one line per field, so a line number names the field
+    return [" ".join(str(value or "").split()) for value in values]
+
+class SearchIndex:
+    """
+    Pass `database` (and `qa_collection`) to run against a stand-in such as
+    mongomock-motor; by default the index lives in textfrombooks and pairs are read
+    from qa_pair.qa_pairs.
+    """
+
+    def __init__(self, database=None, qa_collection=None):
+        self._database = database
+        self._qa_collection = qa_collection
+
+    @property
+    def database(self):
+        return self._database if self._database is not None else db.get_books_db()
+
+    @property
+    def qa_collection(self):
+        return self._qa_collection if self._qa_collection is not None else db.get_db().qa_pairs
+
+    async def ensure_indexes(self):
+        postings = self.database.search_postings
+        await postings.create_index([("term", ASCENDING), ("doc", ASCENDING)])
+        await postings.create_index([("doc", ASCENDING)])
+        await postings.create_index([("book_id", ASCENDING)])
+
+    # ---- writing ----
+
+    async def _add(self, docs: List[dict]):
+        """docs: {"doc", "kind", "lines", ...fields copied onto every posting}."""
+        postings = []
+        df = Counter()
+        total_tokens = 0
+        for doc in docs:
+            lines = doc.pop("lines")
+            terms, length = _line_terms(lines)
+            if not terms:
+                continue
+            total_tokens += length
+            for term, (tf, on_lines) in terms.items():
+                df[term] += 1
+                postings.append({"term": term, "tf": tf, "dl": length, "lines": on_lines, **doc})
+        if not postings:
+            return
+        database = self.database
+        for start in range(0, len(postings), WRITE_BATCH):
+            await database.search_postings.insert_many(postings[start:start + WRITE_BATCH], ordered=False)
+        ops = [UpdateOne({"_id": term}, {"$inc": {"df": n}}, upsert=True) for term, n in df.items()]
+        for start in range(0, len(ops), WRITE_BATCH):
+            await database.search_terms.bulk_write(ops[start:start + WRITE_BATCH], ordered=False)
+        docs_added = len({posting["doc"] for posting in postings})
+        await database.search_meta.update_one(
+            {"_id": "stats"}, {"$inc": {"docs": docs_added, "tokens": total_tokens}}, upsert=True
+        )
+
+    async def _remove(self, query: dict):
+        database = self.database
+        df = Counter()
+        lengths: Dict[str, int] = {}
+        async for posting in database.search_postings.find(query, {"term": 1, "doc": 1, "dl": 1}):
+            df[posting["term"]] += 1
+            lengths[posting["doc"]] = posting["dl"]
+        if not lengths:
+            return
+        await database.search_postings.delete_many(query)
+        ops = [UpdateOne({"_id": term}, {"$inc": {"df": -n}}) for term, n in df.items()]
+        for start in range(0, len(ops), WRITE_BATCH):
+            await database.search_terms.bulk_write(ops[start:start + WRITE_BATCH], ordered=False)
+        await database.search_terms.delete_many({"_id": {"$in": list(df)}, "df": {"$lte": 0}})
+        await database.search_meta.update_one(
+            {"_id": "stats"}, {"$inc": {"docs": -len(lengths), "tokens": -sum(lengths.values())}}
+        )
+
+    async def index_book(self, book_id: str) -> int:
+        """(Re)index every stored page of a book. Returns the number of pages indexed."""
+        books_db = self.database
+        await self._remove({"book_id": book_id})
+        book = await books_db.books.find_one({"_id": book_id}, {"content": 1})
+        if book is None:
+            return 0
+        if book.get("content"):
+            # processed before page storage: the whole book is one document
+            await self._add([{"doc": book_id, "kind": "book", "book_id": book_id, "page": None,
+                              "lines": book["content"].split("\n")}])
+            return 1
+        indexed = 0
+        batch = []
+        cursor = books_db.book_pages.find({"book_id": book_id}, {"page": 1, "text": 1}).sort("page", 1)
+        async for page in cursor:
+            if not page.get("text"):
+                continue
+            batch.append({"doc": page["_id"], "kind": "book", "book_id": book_id, "page": page["page"],
+                          "lines": page["text"].split("\n")})
+            if len(batch) >= PAGE_BATCH:
+                await self._add(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            await self._add(batch)
+            indexed += len(batch)
+        return indexed
+
+    async def index_pairs(self, pairs: List[dict]):
+        """Index newly inserted QA pairs (documents with their _id)."""
+        await self._add([{"doc": f"qa:{pair['_id']}", "kind": "qa", "ref": str(pair["_id"]),
+                          "lines": _qa_lines(pair)} for pair in pairs])
+
+    # ---- querying ----
+
+    async def _expand(self, word: str) -> Tuple[List[str], int]:
+        """Indexed words matching a query word, and their summed document frequency."""
+        terms = self.database.search_terms
+        if len(word) < MIN_PREFIX_CHARS:
+            doc = await terms.find_one({"_id": word, "df": {"$gt": 0}})
+            return ([word], doc["df"]) if doc else ([], 0)
+        # an anchored regex on _id is a range scan of the index, in sort order, so the
+        # exact word (the shortest match) comes first
+        cursor = terms.find({"_id": {"$regex": "^" + re.escape(word)}, "df": {"$gt": 0}}) \
+            .sort("_id", 1).limit(PREFIX_EXPANSION)
+        matches = await cursor.to_list(length=PREFIX_EXPANSION)
+        return [m["_id"] for m in matches], sum(m["df"] for m in matches)
+
+    async def search(self, query: str, kind: Optional[str] = None, book_id: Optional[str] = None,
+                     limit: int = 20) -> dict:
+        """
+        Pages and pairs containing every word of `query` (each as a word or a word
+        prefix), ranked by BM25, with the matching line numbers and their text.
+        """
+        started = time.perf_counter()
+        words = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        empty = {"query": query, "total": 0, "results": []}
+        if not words:
+            return empty
+
+        database = self.database
+        groups = []
+        for word in words:
+            terms, df = await self._expand(word)
+            if not terms:
+                return {**empty, "took_ms": round((time.perf_counter() - started) * 1000, 1)}
+            groups.append((df, terms))
+        # rarest word first: its postings bound the candidates
+        groups.sort(key=lambda group: group[0])
+
+        meta = await database.search_meta.find_one({"_id": "stats"}) or {}
+        n_docs = max(meta.get("docs", 0), 1)
+        avg_length = max(meta.get("tokens", 0), 1) / n_docs
+        term_df = {}
+        async for doc in database.search_terms.find({"_id": {"$in": [t for _, terms in groups for t in terms]}}):
+            term_df[doc["_id"]] = doc["df"]
+
+        def score(posting: dict) -> float:
+            df = term_df.get(posting["term"], 1)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            tf = posting["tf"]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * posting["dl"] / avg_length)
+            return idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        projection = {"_id": 0, "doc": 1, "term": 1, "tf": 1, "dl": 1, "lines": 1,
+                      "kind": 1, "book_id": 1, "page": 1, "ref": 1}
+        base = {}
+        if kind:
+            base["kind"] = kind
+        if book_id:
+            base["book_id"] = book_id
+
+        hits: Dict[str, dict] = {}
+        for i, (_, terms) in enumerate(groups):
+            query_doc = {**base, "term": {"$in": terms}}
+            if i > 0:
+                query_doc["doc"] = {"$in": list(hits)}
+            matched: Dict[str, dict] = {}
+            async for posting in database.search_postings.find(query_doc, projection).limit(MAX_CANDIDATES):
+                doc = posting["doc"]
+                if i > 0 and doc not in hits:
+                    continue
+                hit = matched.get(doc)
+                if hit is None:
+                    previous = hits.get(doc)
+                    hit = matched[doc] = {
+                        "posting": posting,
+                        "score": previous["score"] if previous else 0.0,
+                        "group_score": 0.0,
+                        "lines": set(previous["lines"]) if previous else set(),
+                    }
+                # a word counts once per document: the best of the words it expanded to
+                hit["group_score"] = max(hit["group_score"], score(posting))
+                hit["lines"].update(posting["lines"])
+            for hit in matched.values():
+                hit["score"] += hit.pop("group_score")
+            hits = matched
+            if not hits:
+                break
+
+        ranked = sorted(hits.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+        results = [await self._result(hit) for hit in ranked] if ranked else []
+        return {"query": query, "total": len(hits), "results": results,
+                "took_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    async def _result(self, hit: dict) -> dict:
+        posting = hit["posting"]
+        line_numbers = sorted(hit["lines"])
+        result = {"kind": posting["kind"], "score": round(hit["score"], 4), "line_numbers": line_numbers}
+        wanted = line_numbers[:SNIPPET_LINES]
+        if posting["kind"] == "qa":
+            result["id"] = posting["ref"]
+            pair = await self.qa_collection.find_one({"_id": ObjectId(posting["ref"])},
+                                                      {field: 1 for field in QA_FIELDS})
+            lines = _qa_lines(pair) if pair else []
+            result["lines"] = [{"line": n, "field": QA_FIELDS[n], "text": lines[n]}
+                               for n in wanted if n < len(lines)]
+            return result
+
+        result["book_id"] = posting["book_id"]
+        result["page"] = posting["page"]
+        if posting["page"] is None:
+            book = await self.database.books.find_one({"_id": posting["book_id"]}, {"content": 1})
+            text = (book or {}).get("content") or ""
+        else:
+            page = await self.database.book_pages.find_one({"_id": posting["doc"]}, {"text": 1})
+            text = (page or {}).get("text") or ""
+        lines = text.split("\n")
+        result["lines"] = [{"line": n, "text": lines[n]} for n in wanted if n < len(lines)]
+        return result
+
+    # ---- maintenance ----
+
+    async def rebuild(self):
+        """Drop the index and build it again from every completed book and every QA pair."""
+        database = self.database
+        for name in ("search_postings", "search_terms", "search_meta"):
+            await database.drop_collection(name)
+        await self.ensure_indexes()
+        books = 0
+        async for book in database.books.find({"status": "completed"}, {"_id": 1}):
+            await self.index_book(book["_id"])
+            books += 1
+        pairs = 0
+        batch = []
+        async for pair in self.qa_collection.find({}, {"_id": 1, **{field: 1 for field in QA_FIELDS}}):
+            batch.append(pair)
+            if len(batch) >= WRITE_BATCH:
+                await self.index_pairs(batch)
+                pairs += len(batch)
+                batch = []
+        if batch:
+            await self.index_pairs(batch)
+            pairs += len(batch)
+        return {"books": books, "pairs": pairs}
+
+search_index = SearchIndex()
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the full-text search index.")
+    parser.add_argument("--rebuild", action="store_true", help="index every completed book and QA pair again")
+    parser.add_argument("query", nargs="?", help="run a search and print the results")
+    args = parser.parse_args()
+
+    async def run():
+        db.connect()
+        try:
+            if args.rebuild:
+                print(await search_index.rebuild())
+            if args.query:
+                print(await search_index.search(args.query))
+        finally:
+            db.close()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
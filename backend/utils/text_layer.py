@@ -0,0 +1,60 @@
+"""
+Embedded text of born-digital PDFs, and a check of whether a page's text layer is
+real Kannada-script Unicode (legacy font encodings such as Nudi/Baraha come out as
+Latin or private-use garbage and must still be OCR'd).
+"""
+import os
+import subprocess
+import unicodedata
+from typing import List
+
+# ---------------- CONFIG ----------------
+MIN_KANNADA_CHARS = 40      # a page needs at least this many Kannada letters to be trusted
+MIN_KANNADA_RATIO = 0.6     # share of Kannada among all letters
+MAX_ORPHAN_MARKS = 0.02     # vowel signs / viramas not attached to a letter, per Kannada char
+PDFTOTEXT_TIMEOUT = 300
+# ----------------------------------------
+
+def _is_kannada(ch: str) -> bool:
+    return "\u0C80" <= ch <= "\u0CFF"
+
+def extract_text_layer(pdf_path: str, poppler_path: str = None) -> List[str]:
+    """
+    Text of every page via poppler's pdftotext (one run for the whole book).
+    Returns [] when the PDF has no text layer or pdftotext is unavailable.
+    """
+    binary = os.path.join(poppler_path, "pdftotext") if poppler_path else "pdftotext"
+    try:
+        result = subprocess.run([binary, "-enc", "UTF-8", pdf_path, "-"], capture_output=True,
+                                timeout=PDFTOTEXT_TIMEOUT, check=True)
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"  ⚠️ No text layer extracted: {e}")
+        return []
+    # pages are separated by form feeds, with one after the last page
+    pages = result.stdout.decode("utf-8", errors="replace").split("\f")
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+def text_layer_ok(text: str) -> bool:
+    """True if the page text looks like correctly encoded Kannada script."""
+    kannada = 0
+    letters = 0
+    orphans = 0
+    previous = " "
+    for ch in text:
+        if ch == "\uFFFD" or "\uE000" <= ch <= "\uF8FF":
+            # undecodable or private-use glyphs: a legacy font mapping
+            return False
+        if _is_kannada(ch):
+            kannada += 1
+            letters += 1
+            # a combining sign must follow a Kannada character
+            if unicodedata.category(ch) in ("Mn", "Mc") and not _is_kannada(previous):
+                orphans += 1
+        elif ch.isalpha():
+            letters += 1
+        previous = ch
+    if kannada < MIN_KANNADA_CHARS or kannada < letters * MIN_KANNADA_RATIO:
+        return False
+    return orphans <= kannada * MAX_ORPHAN_MARKS
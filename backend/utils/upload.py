@@ -0,0 +1,191 @@
+"""
+Stream a multipart file upload straight from the request body into a sink
+(a file under uploads/ or a GridFS upload stream), without Starlette's spooled
+temporary file. Size is capped and a sha256 is computed as the bytes go by.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Awaitable, Callable, List, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# ---------------- CONFIG ----------------
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))        # bytes per sink write
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(4 * 1024 * 1024 * 1024)))  # largest accepted file
+# ----------------------------------------
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class DiskSink:
+    """Writes to a local file off the event loop; the partial file is removed on abort."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "wb")
+
+    async def write(self, data: bytes):
+        await asyncio.to_thread(self._f.write, data)
+
+    async def close(self):
+        await asyncio.to_thread(self._f.close)
+
+    async def abort(self):
+        self._f.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class GridFSSink:
+    """Writes to a GridFS upload stream; aborting deletes the chunks written so far."""
+
+    def __init__(self, bucket, filename: str, metadata: dict):
+        self._grid_in = bucket.open_upload_stream(filename, metadata=metadata)
+
+    @property
+    def file_id(self):
+        return self._grid_in._id
+
+    async def write(self, data: bytes):
+        await self._grid_in.write(data)
+
+    async def close(self):
+        await self._grid_in.close()
+
+    async def abort(self):
+        await self._grid_in.abort()
+
+class _FilePart:
+    """Collects parser callbacks for the one form field holding the file."""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.started = False
+        self.finished = False
+        self.received = 0
+        self.buffer: List[bytes] = []
+        self._in_file = False
+        self._headers = {}
+        self._name = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+        self._in_file = False
+
+    def _header_field(self, data, start, end):
+        self._name += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._name.lower()] = self._value
+        self._name = b""
+        self._value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field or b"filename" not in options or self.started:
+            return
+        self.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+        self.content_type = self._headers.get(b"content-type", b"application/octet-stream").decode("latin-1")
+        self.started = True
+        self._in_file = True
+
+    def _part_data(self, data, start, end):
+        if self._in_file:
+            self.buffer.append(bytes(data[start:end]))
+            self.received += end - start
+
+    def _part_end(self):
+        if self._in_file:
+            self.finished = True
+            self._in_file = False
+
+    def take(self) -> bytes:
+        data = b"".join(self.buffer)
+        self.buffer = []
+        return data
+
+async def stream_upload(request, open_sink: Callable[[str, str], Awaitable], field: str = "file",
+                        chunk_bytes: int = UPLOAD_CHUNK_BYTES, max_bytes: int = MAX_UPLOAD_BYTES) -> dict:
+    """
+    Parse a multipart/form-data body as it arrives and write the `field` file part to
+    the sink returned by `await open_sink(filename, content_type)`, which may raise
+    UploadError to refuse the file once its name is known.
+    Returns {filename, content_type, size, sha256, sink}; on any error the sink is aborted.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError(400, "Expected a multipart/form-data upload")
+    declared = request.headers.get("content-length", "")
+    # allow for the part headers and boundaries around the file
+    if declared.isdigit() and int(declared) > max_bytes + 64 * 1024:
+        raise UploadError(413, f"File larger than {max_bytes} bytes")
+
+    part = _FilePart(field)
+    parser = MultipartParser(params[b"boundary"], part.callbacks())
+    checksum = hashlib.sha256()
+    sink = None
+    size = 0
+
+    async def flush():
+        nonlocal size
+        data = part.take()
+        if data:
+            checksum.update(data)
+            size += len(data)
+            await sink.write(data)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if part.received > max_bytes:
+                raise UploadError(413, f"File larger than {max_bytes} bytes")
+            if part.started and sink is None:
+                sink = await open_sink(part.filename, part.content_type)
+            if sink is not None and (part.received - size >= chunk_bytes or part.finished):
+                await flush()
+        parser.finalize()
+
+        if sink is None:
+            raise UploadError(400, f"No file in form field '{field}'")
+        if not part.finished:
+            raise UploadError(400, "Upload was truncated")
+        await flush()
+        await sink.close()
+    except BaseException:
+        if sink is not None:
+            await sink.abort()
+        raise
+
+    return {
+        "filename": part.filename,
+        "content_type": part.content_type,
+        "size": size,
+        "sha256": checksum.hexdigest(),
+        "sink": sink,
+    }
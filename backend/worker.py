@@ -0,0 +1,355 @@
+"""
+Book-processing worker. Leases jobs from the durable queue (jobs.py) and runs
+OCR + cleaning on them. Run standalone with `python worker.py`, or let the API
+start BOOK_WORKERS of them at startup.
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import ASCENDING, ReplaceOne
+
+from database import db
+from jobs import job_queue, HEARTBEAT_SECONDS
+from utils.ocr import iter_book_pages, pdf_page_count, LANG, MAX_PAGE_WORKERS
+from utils.scheduler import scheduler
+from utils.ocr_cache import ocr_cache
+from utils.clean import clean_lines
+from utils.log import log
+from utils.metrics import metrics
+from utils.search import search_index
+from utils.dedup import dedup_index
+
+# ---------------- CONFIG ----------------
+UPLOAD_FOLDER = "uploads"
+POLL_SECONDS = 2
+BOOKS_PER_WORKER = int(os.getenv("BOOKS_PER_WORKER", "2"))   # books sharing this worker's OCR pool
+KEEP_SOURCE_PDF = os.getenv("KEEP_SOURCE_PDF", "1") == "1"   # kept for /reocr; 0 = delete once completed
+PAGE_BATCH = 16                                             # page documents per bulk write
+PROGRESS_SECONDS = 2.0                                      # least time between progress writes
+# ----------------------------------------
+
+class BookProcessingError(Exception):
+    pass
+
+def checkpoint_path(book_id: str) -> str:
+    return os.path.join(UPLOAD_FOLDER, f"{book_id}_pages.jsonl")
+
+def page_id(book_id: str, page_no: int) -> str:
+    return f"{book_id}:{page_no:05d}"
+
+async def process_book(file_path: str, filename: str, book_id: str, priority: int = 0,
+                       pages: Optional[List[int]] = None) -> dict:
+    """
+    OCR -> clean -> store, streamed one page at a time: pages come out of the OCR
+    thread in order, are cleaned line by line and written to `book_pages` in small
+    batches, so the book is never held in memory or as one Mongo document.
+    Cleaned pages are checked against the dedup index: each page records the lines
+    that repeat text seen before (`dup_lines`) and the book gets its dedup ratio.
+    Progress (pages done / total, pages per second) is written to the book document
+    at most every PROGRESS_SECONDS; per-stage times go to the metrics registry and
+    the book's `timings`.
+    Returns the fields to $set on the book document, raises BookProcessingError on
+    failure. The page checkpoint lets retries resume where the last attempt stopped;
+    run_job removes it once the book completes, and the upload too unless
+    KEEP_SOURCE_PDF (page ranges can only be re-OCR'd while it is kept).
+    """
+    book_pages = db.get_books_db().book_pages
+    books = db.get_books_db().books
+
+    try:
+        total_pages = await asyncio.to_thread(pdf_page_count, file_path)
+    except Exception as e:
+        raise BookProcessingError(f"Could not read PDF info: {e}")
+    if total_pages == 0:
+        raise BookProcessingError("No pages found")
+
+    loop = asyncio.get_running_loop()
+    page_queue: asyncio.Queue = asyncio.Queue(maxsize=PAGE_BATCH * 2)
+    abort = threading.Event()
+    ocr_stats = {}
+
+    def produce():
+        ocr_pages = iter_book_pages(file_path, total_pages, scheduler=scheduler,
+                                    book_id=book_id, priority=priority,
+                                    checkpoint_path=checkpoint_path(book_id), pages=pages,
+                                    cache=ocr_cache, stats=ocr_stats)
+        try:
+            for page in ocr_pages:
+                # blocks this thread while the consumer is behind (backpressure)
+                asyncio.run_coroutine_threadsafe(page_queue.put(page), loop).result()
+                if abort.is_set():
+                    break
+        finally:
+            ocr_pages.close()
+            asyncio.run_coroutine_threadsafe(page_queue.put(None), loop).result()
+
+    started = time.monotonic()
+    pages_done = 0
+
+    def progress() -> dict:
+        elapsed = time.monotonic() - started
+        return {
+            "pages_done": pages_done,
+            "pages_total": total_pages,
+            "pages_per_second": round(pages_done / elapsed, 2) if elapsed > 0 else 0.0,
+            "updated_at": str(datetime.now()),
+        }
+
+    await books.update_one({"_id": book_id}, {"$set": {"progress": progress()}})
+    last_report = time.monotonic()
+
+    log("Starting OCR", book_id=book_id, filename=filename, pages=total_pages)
+    producer = loop.run_in_executor(None, produce)
+
+    kept_lines = 0
+    failed_pages = 0
+    duplicate_lines = 0
+    duplicate_pages = 0
+    line_index = []         # [page, first_line, lines], for ranged reads of the book
+    # this attempt's dedup entries: text from an earlier attempt is the book's own
+    run = uuid.uuid4().hex
+    clean_seconds = 0.0
+    dedup_seconds = 0.0
+    db_seconds = 0.0
+    batch = []
+
+    async def write_batch():
+        nonlocal batch, db_seconds
+        start = time.perf_counter()
+        await book_pages.bulk_write(batch, ordered=False)
+        elapsed = time.perf_counter() - start
+        db_seconds += elapsed
+        for _ in batch:
+            metrics.observe("page_stage_seconds", elapsed / len(batch), stage="db_write")
+        batch = []
+
+    try:
+        while True:
+            item = await page_queue.get()
+            if item is None:
+                break
+            page_no, success, text = item
+            start = time.perf_counter()
+            lines = list(clean_lines(text.splitlines())) if success else []
+            elapsed = time.perf_counter() - start
+            clean_seconds += elapsed
+            metrics.observe("page_stage_seconds", elapsed, stage="clean")
+            dup_lines = []
+            if dedup_index is not None and lines:
+                start = time.perf_counter()
+                dup_lines = await dedup_index.check_page(book_id, run, page_no, lines)
+                elapsed = time.perf_counter() - start
+                dedup_seconds += elapsed
+                metrics.observe("page_stage_seconds", elapsed, stage="dedup")
+                duplicate_lines += len(dup_lines)
+                duplicate_pages += 1 if len(dup_lines) == len(lines) else 0
+            line_index.append([page_no, kept_lines, len(lines)])
+            kept_lines += len(lines)
+            failed_pages += 0 if success else 1
+            pages_done += 1
+            batch.append(ReplaceOne(
+                {"_id": page_id(book_id, page_no)},
+                {"book_id": book_id, "page": page_no, "ok": success,
+                 "text": "\n".join(lines), "kept_lines": len(lines), "dup_lines": dup_lines},
+                upsert=True,
+            ))
+            report_due = time.monotonic() - last_report >= PROGRESS_SECONDS
+            if len(batch) >= PAGE_BATCH or report_due:
+                await write_batch()
+            if report_due:
+                # progress only counts pages that are already stored
+                await books.update_one({"_id": book_id}, {"$set": {"progress": progress()}})
+                last_report = time.monotonic()
+        if batch:
+            await write_batch()
+    except BaseException:
+        # let the OCR thread run down before giving up
+        abort.set()
+        while await page_queue.get() is not None:
+            pass
+        raise
+
+    # re-raises anything the OCR thread hit
+    await producer
+
+    if failed_pages == total_pages:
+        raise BookProcessingError("OCR failed")
+    await book_pages.delete_many({"book_id": book_id, "page": {"$gt": total_pages}})
+
+    looked_up = ocr_stats.get("hits", 0) + ocr_stats.get("misses", 0)
+    cache_report = {key: ocr_stats.get(key, 0) for key in ("hits", "misses", "pdf_match", "bytes_saved")}
+    cache_report["hit_rate"] = round(cache_report["hits"] / looked_up, 3) if looked_up else 0.0
+    timings = {
+        "render": ocr_stats.get("render_seconds", 0.0),
+        "ocr": ocr_stats.get("ocr_seconds", 0.0),
+        "clean": clean_seconds,
+        "dedup": dedup_seconds,
+        "db_write": db_seconds,
+        "total": time.monotonic() - started,
+    }
+    for stage, seconds in timings.items():
+        metrics.observe("book_stage_seconds", seconds, stage=stage)
+    timings = {stage: round(seconds, 3) for stage, seconds in timings.items()}
+    dedup_report = {
+        "lines": kept_lines,
+        "duplicate_lines": duplicate_lines,
+        "duplicate_pages": duplicate_pages,
+        "ratio": round(duplicate_lines / kept_lines, 4) if kept_lines else 0.0,
+    }
+
+    log("Cleaning complete", book_id=book_id, filename=filename, pages=total_pages,
+        failed_pages=failed_pages, kept_lines=kept_lines, peak_rss_mb=ocr_stats.get("peak_rss_mb", 0.0),
+        ocr_cache=cache_report, dedup=dedup_report, timings=timings)
+
+    return {
+        "status": "completed",
+        "pages": total_pages,
+        "failed_pages": failed_pages,
+        "kept_lines": kept_lines,
+        "line_index": line_index,
+        "progress": progress(),
+        "ocr_cache": cache_report,
+        "text_layer_pages": ocr_stats.get("text_layer_pages", 0),
+        "high_dpi_pages": ocr_stats.get("high_dpi_pages", 0),
+        "peak_rss_mb": ocr_stats.get("peak_rss_mb", 0.0),
+        "timings": timings,
+        "dedup": dedup_report,
+        "processed_at": str(datetime.now())
+    }
+
+async def _heartbeat(job: dict, worker_id: str):
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        if not await job_queue.heartbeat(job, worker_id):
+            log("Lost lease on job", level="warning", book_id=job["book_id"], job_id=job["_id"])
+            return
+
+async def run_job(job: dict, worker_id: str):
+    book_id = job["book_id"]
+    file_path = job["file_path"]
+    books = db.get_books_db().books
+    await books.update_one({"_id": book_id}, {"$set": {"status": "processing", "attempts": job["attempts"]}})
+
+    heartbeat = asyncio.create_task(_heartbeat(job, worker_id))
+    try:
+        fields = await process_book(file_path, job["filename"], book_id,
+                                    job.get("priority", 0), job["params"].get("pages"))
+    except Exception as e:
+        log("Error processing book", level="error", book_id=book_id, filename=job["filename"],
+            attempt=job["attempts"], error=str(e))
+        retrying = await job_queue.fail(job, worker_id, str(e))
+        metrics.inc("books_total", outcome="retry" if retrying else "failed")
+        if not retrying:
+            await books.update_one({"_id": book_id}, {"$set": {"status": "failed", "error": str(e)}})
+        return
+    finally:
+        heartbeat.cancel()
+
+    unset = {"error": ""}
+    if not KEEP_SOURCE_PDF:
+        unset["file_path"] = ""
+    await books.update_one({"_id": book_id}, {"$set": fields, "$unset": unset})
+    await job_queue.complete(job, worker_id)
+    # the checkpoint only serves retries; the pages are in book_pages now
+    for path in [checkpoint_path(book_id)] + ([] if KEEP_SOURCE_PDF else [file_path]):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log("Could not remove book file", level="warning", book_id=book_id, path=path, error=str(e))
+    try:
+        start = time.perf_counter()
+        indexed = await search_index.index_book(book_id)
+        metrics.observe("book_stage_seconds", time.perf_counter() - start, stage="index")
+        log("Indexed book for search", book_id=book_id, pages=indexed)
+    except Exception as e:
+        # the book is complete either way: `python -m utils.search --rebuild` catches up
+        log("Error indexing book", level="warning", book_id=book_id, error=str(e))
+    metrics.inc("books_total", outcome="completed")
+    log("Finished book", book_id=book_id, filename=job["filename"])
+
+async def _publish_stats(worker_id: str, running: set):
+    """
+    Scheduler state and metrics live in this process; mirror them to Mongo for
+    GET /api/ocr/scheduler and GET /metrics.
+    """
+    stats = scheduler.stats()
+    metrics.set("ocr_workers", stats["workers"])
+    metrics.set("ocr_in_flight", stats["in_flight"])
+    metrics.set("ocr_queue_depth", stats["queue_depth"])
+    await db.get_books_db().workers.update_one(
+        {"_id": worker_id},
+        {"$set": {"seen_at": datetime.utcnow(), "books": len(running),
+                  "scheduler": stats, "metrics": metrics.snapshot()}},
+        upsert=True,
+    )
+
+def check_ocr(lang: str = LANG):
+    """
+    OCR one blank page through the scheduler, so a worker whose engine pool cannot
+    run pages (tesseract missing, or started as a daemon process) fails at startup
+    instead of failing every book it leases.
+    """
+    from PIL import Image
+
+    path = os.path.join(UPLOAD_FOLDER, f"ocr_check_{os.getpid()}.png")
+    Image.new("L", (200, 60), 255).save(path)
+    job = scheduler.open_job(f"ocr-check-{os.getpid()}", 1)
+    try:
+        _, success, text, _ = scheduler.submit(job, 1, path, lang).result(timeout=120)
+    except Exception as e:
+        raise RuntimeError(f"OCR engine pool cannot run pages: {e!r}") from e
+    finally:
+        scheduler.close_job(job)
+        if os.path.exists(path):
+            os.remove(path)
+    if not success:
+        raise RuntimeError(f"OCR engine cannot read pages: {text}")
+
+async def run_worker(worker_id: str = None):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    scheduler.start(LANG, MAX_PAGE_WORKERS)
+    db.connect()
+    try:
+        await asyncio.to_thread(check_ocr, LANG)
+        await db.get_books_db().book_pages.create_index([("book_id", ASCENDING), ("page", ASCENDING)])
+        await search_index.ensure_indexes()
+        if dedup_index is not None:
+            await dedup_index.ensure_indexes()
+        # jobs orphaned by a dead worker come back through lease() once their lease lapses
+        log("Worker waiting for jobs", worker_id=worker_id)
+
+        running = set()
+        while True:
+            await _publish_stats(worker_id, running)
+            if len(running) < BOOKS_PER_WORKER:
+                job = await job_queue.lease(worker_id)
+                if job:
+                    running.add(asyncio.create_task(run_job(job, worker_id)))
+                    continue
+            if running:
+                _, running = await asyncio.wait(running, timeout=POLL_SECONDS,
+                                                return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(POLL_SECONDS)
+    finally:
+        try:
+            await db.get_books_db().workers.delete_one({"_id": worker_id})
+        except Exception:
+            pass
+        db.close()
+        scheduler.close()
+
+def main():
+    asyncio.run(run_worker())
+
+if __name__ == "__main__":
+    main()